@@ -0,0 +1,65 @@
+from statistics import NormalDist
+
+import numpy as np
+
+from apps.cache import FitCache, fit_key
+from apps.profiling import traced
+
+_cache = FitCache(max_entries=32)
+
+
+def default_nlags(n, seasonal_period=None):
+    # At least 50 lags as before, two full seasonal cycles when a period is known, and
+    # never more than PACF can estimate from n observations
+    nlags = 50
+    if seasonal_period and seasonal_period > 1:
+        nlags = max(nlags, 2 * seasonal_period + 1)
+    return max(1, min(nlags, n // 2 - 1))
+
+
+def fft_acf(values, nlags):
+    x = np.asarray(values, dtype=float)
+    x = x[np.isfinite(x)] - np.nanmean(x)
+    n = len(x)
+    # Zero-pad to avoid circular wrap-around, rounded up to a fast FFT length
+    nfft = 1 << int(np.ceil(np.log2(2 * n - 1)))
+    spectrum = np.fft.rfft(x, nfft)
+    acov = np.fft.irfft(spectrum * np.conj(spectrum), nfft)[:nlags + 1] / n
+    return acov / acov[0] if acov[0] > 0 else np.full(nlags + 1, np.nan)
+
+
+def levinson_durbin_pacf(acf_values, nlags):
+    pacf = np.empty(nlags + 1)
+    pacf[0] = 1.0
+    phi = np.zeros(nlags + 1)
+    sigma = 1.0
+    for k in range(1, nlags + 1):
+        reflection = (acf_values[k] - phi[1:k] @ acf_values[k - 1:0:-1]) / sigma
+        phi[1:k] = phi[1:k] - reflection * phi[k - 1:0:-1]
+        phi[k] = reflection
+        sigma *= 1 - reflection ** 2
+        pacf[k] = reflection
+    return pacf
+
+
+@traced()
+def autocorrelation(series, seasonal_period=None, nlags=None, alpha=0.05):
+    # ACF, PACF and their confidence bands, cached on the series contents
+    nlags = nlags or default_nlags(len(series), seasonal_period)
+    key = fit_key("autocorrelation", series, nlags=nlags, alpha=alpha)
+    result = _cache.get(key)
+    if result is None:
+        n = int(np.isfinite(series.to_numpy(dtype=float)).sum())
+        acf_values = fft_acf(series.to_numpy(), nlags)
+        # The standard library quantile avoids importing scipy.stats for one number
+        z = NormalDist().inv_cdf(1 - alpha / 2)
+        # Bartlett's formula for the ACF, 1/sqrt(n) for the PACF
+        acf_band = z * np.sqrt(np.r_[1, 1 + 2 * np.cumsum(acf_values[1:-1] ** 2)] / n)
+        result = {
+            "acf": acf_values,
+            "pacf": levinson_durbin_pacf(acf_values, nlags),
+            "acf_band": np.r_[np.nan, acf_band],
+            "pacf_band": np.r_[np.nan, np.full(nlags, z / np.sqrt(n))],
+        }
+        _cache.put(key, result)
+    return result
@@ -0,0 +1,121 @@
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from apps.holt_winters import fixed_params, refilter, states_at, forecast_from_states
+from apps.utils import fit_sarimax, filter_sarimax, fit_holt_winters, check_cancelled, WorkerPool
+
+
+def rolling_origins(n, initial, horizon, step=1):
+    # Each cutoff is the number of observations a fold trains on
+    return np.arange(initial, n - horizon + 1, step)
+
+
+def _training_window(series, cutoff, window):
+    return series.iloc[max(cutoff - window, 0) if window else 0:cutoff]
+
+
+def _sarimax_folds(series, order, seasonal_order, params, cutoffs, horizon, window, refit):
+    forecasts = np.empty((len(cutoffs), horizon))
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        if window is None and not refit:
+            # Filter the whole series once, then forecast dynamically from every origin
+            full = filter_sarimax(series, order, seasonal_order, params)
+            for i, cutoff in enumerate(cutoffs):
+                check_cancelled()
+                forecasts[i] = full.get_prediction(start=cutoff, end=cutoff + horizon - 1, dynamic=True).predicted_mean
+            return forecasts
+        for i, cutoff in enumerate(cutoffs):
+            check_cancelled()
+            train = _training_window(series, cutoff, window)
+            if refit:
+                fold_fit = fit_sarimax(train, order, seasonal_order, start_params=params, disp=False)
+            else:
+                fold_fit = filter_sarimax(train, order, seasonal_order, params)
+            forecasts[i] = fold_fit.forecast(steps=horizon)
+    return forecasts
+
+
+def _holt_winters_folds(series, trend, seasonal, seasonal_periods, hw_params, cutoffs, horizon, window, refit):
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        if window is None and not refit:
+            # One smoothing pass gives the states at every origin
+            level, trend_state, season = states_at(refilter(series, *hw_params), cutoffs)
+            return forecast_from_states(level, trend_state, season, horizon, trend, seasonal)
+        if window and not refit:
+            # A sliding window starts somewhere else, so only the smoothing parameters carry over
+            model_kwargs, fit_kwargs = hw_params
+            model_kwargs = {key: value for key, value in model_kwargs.items() if not key.startswith("initial_")}
+            hw_params = ({**model_kwargs, "initialization_method": "heuristic"}, fit_kwargs)
+        forecasts = np.empty((len(cutoffs), horizon))
+        for i, cutoff in enumerate(cutoffs):
+            check_cancelled()
+            train = _training_window(series, cutoff, window)
+            if refit:
+                fold_fit = fit_holt_winters(train, trend, seasonal, seasonal_periods)
+            else:
+                fold_fit = refilter(train, *hw_params)
+            forecasts[i] = fold_fit.forecast(steps=horizon)
+    return forecasts
+
+
+def fold_metrics(actuals, forecasts):
+    # MAE, MAPE and R2 of every fold in one pass over (folds, horizon) arrays
+    errors = actuals - forecasts
+    mae = np.abs(errors).mean(axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mape = (np.abs(errors) / np.maximum(np.abs(actuals), np.finfo(float).eps)).mean(axis=1)
+        ss_res = (errors ** 2).sum(axis=1)
+        ss_tot = ((actuals - actuals.mean(axis=1, keepdims=True)) ** 2).sum(axis=1)
+        r2 = np.where(ss_tot > 0, 1 - ss_res / ss_tot, np.nan)
+    return mae, mape, r2
+
+
+def backtest(series, horizon, initial=None, step=1, window=None, refit=False, order=(1, 1, 1),
+             seasonal_order=(1, 1, 1, 12), trend="mul", seasonal="mul", seasonal_periods=12, pool=None):
+    # Rolling-origin evaluation of SARIMAX and Holt-Winters. Parameters are estimated once on the first
+    # training window and reused at every origin by re-filtering; refit=True re-estimates per fold,
+    # warm-started from those parameters. window=None expands the training window, an int slides it.
+    n = len(series)
+    initial = initial or max(window or 0, n // 2)
+    cutoffs = rolling_origins(n, initial, horizon, step)
+    if len(cutoffs) == 0:
+        raise ValueError("Series is too short for the requested initial window and horizon")
+
+    first = _training_window(series, cutoffs[0], window)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        params = fit_sarimax(first, order, seasonal_order, disp=False).params.to_dict()
+        hw_params = fixed_params(fit_holt_winters(first, trend, seasonal, seasonal_periods))
+
+    own_pool = pool is None
+    pool = pool or WorkerPool()
+    chunks = [chunk for chunk in np.array_split(cutoffs, min(pool.processes, len(cutoffs)))]
+    jobs = {}
+    for i, chunk in enumerate(chunks):
+        jobs[("SARIMAX", i)] = (_sarimax_folds, (series, order, seasonal_order, params, chunk, horizon, window, refit))
+        jobs[("Holt-Winters", i)] = (_holt_winters_folds, (series, trend, seasonal, seasonal_periods, hw_params, chunk, horizon, window, refit))
+    try:
+        results = pool.run(jobs)
+    finally:
+        if own_pool:
+            pool.terminate()
+    for (name, i), result in results.items():
+        if result.error is not None:
+            raise RuntimeError(f"{name} backtest failed: {result.error}") from result.error
+
+    values = series.to_numpy(dtype=float)
+    actuals = values[cutoffs[:, None] + np.arange(horizon)]
+    frames = []
+    for name in ["SARIMAX", "Holt-Winters"]:
+        forecasts = np.vstack([results[(name, i)].value for i in range(len(chunks))])
+        mae, mape, r2 = fold_metrics(actuals, forecasts)
+        frames.append(pd.DataFrame({"Model": name, "Cutoff": series.index[cutoffs - 1], "MAE": mae, "MAPE": mape, "R2": r2}))
+    return pd.concat(frames, ignore_index=True)
+
+
+def summarize_backtest(folds):
+    return folds.groupby("Model", sort=False)[["MAE", "MAPE", "R2"]].mean()
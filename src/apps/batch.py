@@ -0,0 +1,252 @@
+import argparse
+import sys
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from apps.holt_winters import fit_batch, forecast_batch
+from apps.utils import parse_columns, resample_data, fit_sarimax, fit_holt_winters, WorkerPool
+
+MODELS = ("sarimax", "holt_winters")
+HW_ENGINES = ("statsmodels", "native")
+
+SCHEMA = pa.schema([
+    ("series_id", pa.string()),
+    ("model", pa.string()),
+    ("date", pa.timestamp("ns")),
+    ("forecast", pa.float64()),
+    ("error", pa.string()),
+])
+
+
+def iter_series(df, id_cols, date_col, target_col, frequency):
+    for series_id, group in df.groupby(id_cols, sort=False):
+        series_id = "/".join(str(part) for part in series_id)
+        yield series_id, resample_data(group, date_col, target_col, frequency)[target_col]
+
+
+def forecast_series(series_id, series, horizon, models, order, seasonal_order, trend, seasonal, seasonal_periods):
+    start = time.perf_counter()
+    frames = []
+    errors = []
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        for model in models:
+            try:
+                if model == "sarimax":
+                    forecast = fit_sarimax(series, order, seasonal_order, disp=False).forecast(steps=horizon)
+                else:
+                    forecast = fit_holt_winters(series, trend, seasonal, seasonal_periods).forecast(steps=horizon)
+            except Exception as e:
+                errors.append((model, f"{type(e).__name__}: {e}"))
+                continue
+            frames.append(pd.DataFrame({"model": model, "date": forecast.index, "forecast": forecast.to_numpy(dtype=float)}))
+    for model, error in errors:
+        frames.append(pd.DataFrame({"model": [model], "date": [pd.NaT], "forecast": [np.nan], "error": [error]}))
+    result = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=["model", "date", "forecast"])
+    result.insert(0, "series_id", series_id)
+    return series_id, result, len(errors), time.perf_counter() - start
+
+
+def series_matrix(df, id_cols, date_col, target_col, frequency):
+    # Every series resampled at once into a (series, period) array, NaN outside each series' own
+    # span. Gives the same values as iter_series without a resample call per series.
+    grouped = df.groupby(id_cols + [pd.Grouper(key=date_col, freq=frequency)], sort=False)[target_col].sum()
+    wide = grouped.unstack(date_col)
+    wide = wide.reindex(columns=pd.date_range(wide.columns.min(), wide.columns.max(), freq=frequency))
+    values = wide.to_numpy(dtype=float)
+    observed = ~np.isnan(values)
+    first = observed.argmax(axis=1)
+    last = values.shape[1] - 1 - observed[:, ::-1].argmax(axis=1)
+    # Empty periods inside a series' span sum to zero, as in resample_data
+    inside = (np.arange(values.shape[1]) >= first[:, None]) & (np.arange(values.shape[1]) <= last[:, None])
+    values[inside & ~observed] = 0.0
+    series_ids = np.array(["/".join(str(part) for part in (key if isinstance(key, tuple) else (key,))) for key in wide.index], dtype=object)
+    return series_ids, wide.columns, values, first, last
+
+
+def _native_batches(df, id_cols, date_col, target_col, frequency, chunk_size):
+    # Series sharing a span stack into one array; yields (series ids, dates, values) per chunk
+    series_ids, dates, values, first, last = series_matrix(df, id_cols, date_col, target_col, frequency)
+    spans = pd.DataFrame({"first": first, "last": last}).groupby(["first", "last"], sort=False).indices
+    for (start, end), rows in spans.items():
+        for chunk in range(0, len(rows), chunk_size):
+            rows_chunk = rows[chunk:chunk + chunk_size]
+            yield series_ids[rows_chunk], dates[start:end + 1], values[rows_chunk, start:end + 1]
+
+
+def forecast_series_batch(series_ids, index, values, horizon, trend, seasonal, seasonal_periods):
+    # Holt-Winters forecasts for series of equal length ending on the same date, fitted together
+    dates = pd.date_range(index[-1], periods=horizon + 1, freq=index.freq)[1:]
+    ok = np.ones(len(series_ids), dtype=bool)
+    messages = np.full(len(series_ids), None, dtype=object)
+    if trend == "mul" or seasonal == "mul":
+        ok = ~(values <= 0).any(axis=1)
+        messages[~ok] = "ValueError: Multiplicative trend or seasonality requires strictly positive values"
+    forecasts = np.full((len(series_ids), horizon), np.nan)
+    if ok.any():
+        try:
+            forecasts[ok] = forecast_batch(fit_batch(values[ok], trend, seasonal, seasonal_periods), horizon)
+        except Exception as e:
+            messages[ok] = f"{type(e).__name__}: {e}"
+            ok[:] = False
+    frames = [pd.DataFrame({
+        "series_id": np.repeat(series_ids[ok], horizon),
+        "model": "holt_winters",
+        "date": np.tile(dates, ok.sum()),
+        "forecast": forecasts[ok].ravel(),
+    })]
+    if not ok.all():
+        frames.append(pd.DataFrame({"series_id": series_ids[~ok], "model": "holt_winters", "date": pd.NaT,
+                                    "forecast": np.nan, "error": messages[~ok]}))
+    return frames, list(series_ids[~ok])
+
+
+def run_batch(df, output_path, id_cols, date_col, target_col, date_format="%Y-%m-%d", frequency="M", horizon=12,
+              models=MODELS, order=(1, 1, 1), seasonal_order=(1, 1, 1, 12), trend="mul", seasonal="mul",
+              seasonal_periods=12, pool=None, flush_rows=50000, on_progress=None, hw_engine="statsmodels",
+              native_chunk_size=2000):
+    # hw_engine="native" fits Holt-Winters with the batched engine in this process, many series per
+    # NumPy pass; only the remaining models go to the worker pool
+    if hw_engine not in HW_ENGINES:
+        raise ValueError(f"hw_engine must be one of {HW_ENGINES}")
+    id_cols = list(id_cols)
+    # Dates and values are parsed once for the whole file, then each group is resampled like preprocess_data
+    df = parse_columns(df[id_cols + [date_col, target_col]].copy(), date_col, target_col, date_format)
+    total = df.groupby(id_cols, sort=False).ngroups
+    native = hw_engine == "native" and "holt_winters" in models
+    pool_models = tuple(model for model in models if not (native and model == "holt_winters"))
+
+    start = time.monotonic()
+    failed = set()
+    buffer = []
+    buffered_rows = 0
+    writer = pq.ParquetWriter(output_path, SCHEMA)
+
+    def collect(frames):
+        nonlocal buffer, buffered_rows
+        buffer.extend(frames)
+        buffered_rows += sum(len(frame) for frame in frames)
+        # Results stream to disk in row groups instead of being held until the end
+        if buffered_rows >= flush_rows:
+            _write(writer, buffer)
+            buffer, buffered_rows = [], 0
+
+    own_pool = pool is None and bool(pool_models)
+    try:
+        if native:
+            done = 0
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                for series_ids, dates, values in _native_batches(df, id_cols, date_col, target_col, frequency, native_chunk_size):
+                    frames, errors = forecast_series_batch(series_ids, dates, values, horizon, trend, seasonal, seasonal_periods)
+                    collect(frames)
+                    failed.update(errors)
+                    done += len(series_ids)
+                    if on_progress is not None:
+                        on_progress(done, total, len(failed), time.monotonic() - start)
+        if pool_models:
+            pool = pool or WorkerPool()
+            args = (
+                (series_id, values, horizon, pool_models, order, seasonal_order, trend, seasonal, seasonal_periods)
+                for series_id, values in iter_series(df, id_cols, date_col, target_col, frequency)
+            )
+            done = 0
+            for series_id, result, errors, seconds in pool.imap_unordered(forecast_series, args):
+                done += 1
+                if errors:
+                    failed.add(series_id)
+                collect([result])
+                if on_progress is not None:
+                    on_progress(done, total, len(failed), time.monotonic() - start)
+        _write(writer, buffer)
+    finally:
+        writer.close()
+        if own_pool:
+            pool.terminate()
+
+    elapsed = time.monotonic() - start
+    return {"series": total, "failed": len(failed), "seconds": elapsed, "series_per_second": total / elapsed if elapsed else float("inf")}
+
+
+def _write(writer, frames):
+    if not frames:
+        return
+    table = pd.concat(frames, ignore_index=True).reindex(columns=SCHEMA.names)
+    writer.write_table(pa.Table.from_pandas(table, schema=SCHEMA, preserve_index=False))
+
+
+def synthetic_long_data(n_series, length, frequency="M", seed=0):
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range("2000-01-01", periods=length, freq=frequency)
+    t = np.arange(length)
+    level = rng.uniform(50, 500, size=(n_series, 1))
+    trend = rng.uniform(0, 0.01, size=(n_series, 1))
+    season = 1 + 0.2 * np.sin(2 * np.pi * t / 12 + rng.uniform(0, 2 * np.pi, size=(n_series, 1)))
+    values = level * (1 + trend * t) * season * rng.lognormal(0, 0.05, size=(n_series, length))
+    return pd.DataFrame({
+        "series": np.repeat([f"S{i:05d}" for i in range(n_series)], length),
+        "date": np.tile(dates.strftime("%Y-%m-%d"), n_series),
+        "value": values.ravel(),
+    })
+
+
+def _print_progress(done, total, failed, elapsed):
+    print(f"\r{done}/{total} series, {failed} failed, {done / max(elapsed, 1e-9):.1f} series/s", end="", file=sys.stderr, flush=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Forecast every series in a long-format CSV without the Streamlit app.")
+    parser.add_argument("input", nargs="?", help="Long-format CSV with one row per id and date")
+    parser.add_argument("output", help="Parquet file to write forecasts to")
+    parser.add_argument("--id-col", action="append", dest="id_cols", help="Column identifying a series, repeat for composite ids")
+    parser.add_argument("--date-col", default="date")
+    parser.add_argument("--target-col", default="value")
+    parser.add_argument("--date-format", default="%Y-%m-%d")
+    parser.add_argument("--frequency", default="M", choices=["D", "W", "M", "Q", "Y"])
+    parser.add_argument("--horizon", type=int, default=12)
+    parser.add_argument("--models", nargs="+", default=list(MODELS), choices=MODELS)
+    parser.add_argument("--order", type=int, nargs=3, default=[1, 1, 1])
+    parser.add_argument("--seasonal-order", type=int, nargs=4, default=[1, 1, 1, 12])
+    parser.add_argument("--trend", default="mul", choices=["add", "mul", "none"])
+    parser.add_argument("--seasonal", default="mul", choices=["add", "mul", "none"])
+    parser.add_argument("--seasonal-periods", type=int, default=12)
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--hw-engine", default="statsmodels", choices=HW_ENGINES,
+                        help="native fits Holt-Winters for many series at once with NumPy")
+    parser.add_argument("--benchmark", type=int, metavar="N_SERIES",
+                        help="Ignore the input CSV and measure throughput on N synthetic monthly series")
+    parser.add_argument("--benchmark-length", type=int, default=120)
+    args = parser.parse_args(argv)
+
+    if args.benchmark:
+        df = synthetic_long_data(args.benchmark, args.benchmark_length, args.frequency)
+        args.id_cols, args.date_col, args.target_col = ["series"], "date", "value"
+    elif args.input:
+        df = pd.read_csv(args.input)
+    else:
+        parser.error("an input CSV is required unless --benchmark is given")
+    if not args.id_cols:
+        parser.error("at least one --id-col is required")
+
+    pool = WorkerPool(args.processes)
+    try:
+        stats = run_batch(
+            df, args.output, args.id_cols, args.date_col, args.target_col, args.date_format, args.frequency,
+            horizon=args.horizon, models=args.models, order=tuple(args.order), seasonal_order=tuple(args.seasonal_order),
+            trend=None if args.trend == "none" else args.trend, seasonal=None if args.seasonal == "none" else args.seasonal,
+            seasonal_periods=args.seasonal_periods, pool=pool, on_progress=_print_progress, hw_engine=args.hw_engine,
+        )
+    finally:
+        pool.terminate()
+    print(file=sys.stderr)
+    print(f"{stats['series']} series ({stats['failed']} with errors) in {stats['seconds']:.2f}s: "
+          f"{stats['series_per_second']:.2f} series/s")
+
+
+if __name__ == "__main__":
+    main()
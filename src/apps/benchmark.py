@@ -0,0 +1,350 @@
+import argparse
+import gc
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+import matplotlib.pyplot as plt
+import statsmodels
+from sklearn.metrics import mean_absolute_error, mean_absolute_percentage_error, r2_score
+
+from apps import autocorr
+from apps.batch import synthetic_long_data, run_batch
+from apps.holt_winters import fit_batch, forecast_batch
+from apps.utils import (load_data, load_series_chunked, preprocess_data, train_test_split, sarimax_forecast,
+                        holt_winters_forecast, calculate_kpis, WorkerPool, QUANTILES)
+from apps.visualizations import plot_entire_data, plot_forecasts, plot_decomposition, plot_acf_pacf, plot_mape
+
+SAMPLE_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "sample data sets")
+
+# file, date column, target column, date format, frequency, seasonal period
+DATASETS = {
+    "electricity": ("Electricity Production - Electric_Production (1).csv", "DATE", "IPG2211A2N", "%Y-%m-%d", "M", 12),
+    "beer": ("beer australia - Sheet1.csv", "Month", "Monthly beer production", "%Y-%m-%d", "M", 12),
+    "temperature": ("daily minimum temp - Sheet1.csv", "Date", "Daily minimum temperatures", "%Y-%m-%d", "M", 12),
+    "sales": ("hypothetical_sales_data.csv", "date", "sales", "%Y-%m-%d", "M", 12),
+}
+ORDER, SEASONAL_ORDER = (1, 1, 1), (1, 1, 1, 12)
+
+
+def _status_mb(field):
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(field):
+                return int(line.split()[1]) / 1024
+    return None
+
+
+def reset_peak_rss():
+    # Linux resets the VmHWM high-water mark on writing 5 to clear_refs; elsewhere the peak only grows
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return _status_mb("VmRSS")
+    except OSError:
+        return peak_rss()
+
+
+def peak_rss():
+    try:
+        return _status_mb("VmHWM")
+    except OSError:
+        import resource
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return maxrss / 2 ** 20 if sys.platform == "darwin" else maxrss / 1024
+
+
+def measure(func, setup=None, repeat=3):
+    # Median wall time over ``repeat`` calls; setup() builds fresh arguments outside the timed region
+    runs, peak, delta = [], 0.0, 0.0
+    result = None
+    for _ in range(repeat):
+        args = setup() if setup else ()
+        gc.collect()
+        base = reset_peak_rss()
+        start = time.perf_counter()
+        result = func(*args)
+        runs.append(time.perf_counter() - start)
+        high = peak_rss()
+        peak, delta = max(peak, high), max(delta, high - base)
+    return result, {"seconds": float(np.median(runs)), "runs": runs, "peak_rss_mb": round(peak, 1), "rss_delta_mb": round(delta, 1)}
+
+
+def scaled_rows(raw, date_col, target_col, n_rows, seed=0):
+    # n_rows raw rows over the same dates: each original row is split into noisy parts that sum to
+    # roughly its value, so preprocessing produces the same series shape from more input
+    rng = np.random.default_rng(seed)
+    idx = np.sort(rng.integers(0, len(raw), n_rows))
+    copies = np.bincount(idx, minlength=len(raw))
+    values = pd.to_numeric(raw[target_col], errors="coerce").to_numpy(dtype=float)
+    return pd.DataFrame({
+        date_col: raw[date_col].to_numpy()[idx],
+        target_col: values[idx] / copies[idx] * rng.lognormal(0, 0.05, n_rows),
+    })
+
+
+def scaled_series(series, length, seed=0):
+    # A longer series at the same frequency that repeats the seasonal pattern and continues the trend
+    rng = np.random.default_rng(seed)
+    values = series.to_numpy(dtype=float)
+    cycles = np.arange(length) // len(values)
+    drift = (values[-1] - values[0]) * cycles
+    tiled = np.resize(values, length) + drift
+    index = pd.date_range(series.index[0], periods=length, freq=series.index.freq)
+    return pd.Series(tiled * rng.lognormal(0, 0.02, length), index=index, name=series.name)
+
+
+def model_cases(name, series, seasonal_periods, repeat):
+    cases = []
+    df = series.to_frame()
+    train, test = train_test_split(df, 0.2)
+    train, test = train[series.name], test[series.name]
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        sarimax_pred, stats = measure(lambda: sarimax_forecast(train, test, ORDER, SEASONAL_ORDER), repeat=repeat)
+        cases.append({"stage": "sarimax_forecast", **stats})
+        (_, hw_pred), stats = measure(lambda: holt_winters_forecast(train, test, "mul", "mul", seasonal_periods), repeat=repeat)
+        cases.append({"stage": "holt_winters_forecast", **stats})
+        _, stats = measure(lambda: holt_winters_forecast(train, test, "mul", "mul", seasonal_periods, quantiles=QUANTILES), repeat=repeat)
+        cases.append({"stage": "holt_winters_intervals", **stats})
+        native_pred, stats = measure(lambda: forecast_batch(fit_batch(train.to_numpy()[None], "mul", "mul", seasonal_periods), len(test))[0],
+                                     repeat=repeat)
+        # Checked against the statsmodels fit above on the same holdout
+        cases.append({"stage": "holt_winters_native", **stats, "accuracy": {
+            name: {"MAE": mean_absolute_error(test, pred), "MAPE": mean_absolute_percentage_error(test, pred), "R2": r2_score(test, pred)}
+            for name, pred in [("Holt-Winters", hw_pred), ("Holt-Winters native", native_pred)]
+        }})
+
+    kpis, stats = measure(lambda: calculate_kpis(test, sarimax_pred, hw_pred), repeat=repeat)
+    cases.append({"stage": "calculate_kpis", **stats, "accuracy": kpis.to_dict(orient="index")})
+
+    date_col = df.index.name or "date"
+    _, stats = measure(lambda: plot_entire_data(series.rename_axis(date_col), date_col, series.name), repeat=repeat)
+    cases.append({"stage": "plot_entire_data", **stats})
+    _, stats = measure(lambda: plot_forecasts(train, test, sarimax_pred, "SARIMAX"), repeat=repeat)
+    cases.append({"stage": "plot_forecasts", **stats})
+    _, stats = measure(lambda: plot_decomposition(train, seasonal_periods), repeat=repeat)
+    plt.close("all")
+    cases.append({"stage": "plot_decomposition", **stats})
+    # The autocorrelation cache would turn every repeat after the first into a lookup
+    _, stats = measure(lambda: plot_acf_pacf(series, seasonal_periods), setup=lambda: autocorr._cache.clear() or (), repeat=repeat)
+    cases.append({"stage": "plot_acf_pacf", **stats})
+    _, stats = measure(lambda: plot_mape(kpis), repeat=repeat)
+    cases.append({"stage": "plot_mape", **stats})
+    return [{"id": f"{name}/{case['stage']}", "dataset": name, "length": len(series), **case} for case in cases]
+
+
+def dataset_cases(name, repeat):
+    file, date_col, target_col, date_format, frequency, seasonal_periods = DATASETS[name]
+    path = os.path.join(SAMPLE_DIR, file)
+    raw, stats = measure(lambda: load_data(path), repeat=repeat)
+    cases = [{"id": f"{name}/load_data", "dataset": name, "stage": "load_data", "rows": len(raw), **stats}]
+    df, stats = measure(lambda frame: preprocess_data(frame, date_col, target_col, date_format, frequency),
+                        setup=lambda: (raw.copy(),), repeat=repeat)
+    cases.append({"id": f"{name}/preprocess_data", "dataset": name, "stage": "preprocess_data", "rows": len(raw), **stats})
+    return cases + model_cases(name, df[target_col], seasonal_periods, repeat)
+
+
+def row_scaling_cases(name, sizes, repeat, directory):
+    # Load and preprocessing cost grows with input rows, the resampled series (and the models) do not
+    file, date_col, target_col, date_format, frequency, _ = DATASETS[name]
+    raw = pd.read_csv(os.path.join(SAMPLE_DIR, file))
+    cases = []
+    for n_rows in sizes:
+        path = os.path.join(directory, f"{name}-{n_rows}.csv")
+        scaled_rows(raw, date_col, target_col, n_rows).to_csv(path, index=False)
+        prefix = f"{name}@{n_rows}"
+        loaded, stats = measure(lambda: load_data(path), repeat=repeat)
+        cases.append({"id": f"{prefix}/load_data", "dataset": name, "stage": "load_data", "rows": n_rows, **stats})
+        df, stats = measure(lambda frame: preprocess_data(frame, date_col, target_col, date_format, frequency),
+                            setup=lambda: (loaded.copy(),), repeat=repeat)
+        cases.append({"id": f"{prefix}/preprocess_data", "dataset": name, "stage": "preprocess_data", "rows": n_rows, **stats})
+        del loaded
+
+        def chunked():
+            with open(path, "rb") as f:
+                return load_series_chunked(f, date_col, target_col, date_format, frequency)
+        _, stats = measure(chunked, repeat=repeat)
+        cases.append({"id": f"{prefix}/load_series_chunked", "dataset": name, "stage": "load_series_chunked", "rows": n_rows, **stats})
+        os.remove(path)
+    return cases
+
+
+def length_scaling_cases(name, lengths, repeat):
+    file, date_col, target_col, date_format, frequency, seasonal_periods = DATASETS[name]
+    series = preprocess_data(pd.read_csv(os.path.join(SAMPLE_DIR, file)), date_col, target_col, date_format, frequency)[target_col]
+    cases = []
+    for length in lengths:
+        for case in model_cases(f"{name}~{length}", scaled_series(series, length), seasonal_periods, repeat):
+            cases.append({**case, "dataset": name})
+    return cases
+
+
+def many_series_cases(n_series, length, directory, processes=None, native_series=0):
+    cases = []
+    runs = [("run_batch", n_series, {})]
+    if native_series:
+        runs.append(("run_batch_native_hw", native_series, {"models": ["holt_winters"], "hw_engine": "native"}))
+    pool = WorkerPool(processes)
+    try:
+        for stage, count, kwargs in runs:
+            if not count:
+                continue
+            df = synthetic_long_data(count, length)
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                stats, measured = measure(lambda: run_batch(df, os.path.join(directory, "batch.parquet"), ["series"], "date", "value",
+                                                            "%Y-%m-%d", "M", pool=pool, **kwargs), repeat=1)
+            cases.append({"id": f"synthetic x{count}/{stage}", "dataset": "synthetic", "stage": stage, "rows": len(df),
+                          "series": count, "series_per_second": stats["series_per_second"], "failed": stats["failed"], **measured})
+    finally:
+        pool.terminate()
+    return cases
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(__file__), timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "statsmodels": statsmodels.__version__,
+    }
+
+
+def run_suite(datasets, rows, lengths, n_series, series_length, repeat, processes=None, on_case=None, native_series=0):
+    cases = []
+
+    def add(new_cases):
+        for case in new_cases:
+            cases.append(case)
+            if on_case:
+                on_case(case)
+
+    # Lazy imports and first-call setup (plotly templates, matplotlib fonts) would otherwise be charged
+    # to whichever dataset runs first
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        dataset_cases(datasets[0], repeat=1)
+
+    with tempfile.TemporaryDirectory() as directory:
+        for name in datasets:
+            add(dataset_cases(name, repeat))
+        if rows:
+            add(row_scaling_cases(datasets[0], rows, repeat, directory))
+        if lengths:
+            add(length_scaling_cases(datasets[0], lengths, repeat))
+        if n_series or native_series:
+            add(many_series_cases(n_series, series_length, directory, processes, native_series))
+    return {"environment": environment(), "repeat": repeat, "cases": cases}
+
+
+def compare(baseline, current, threshold=0.2, min_seconds=0.02, accuracy_tolerance=0.01):
+    # Flags cases that got slower or used more memory by more than ``threshold`` (relative), or whose
+    # MAPE rose by more than ``accuracy_tolerance`` (absolute). Cases faster than min_seconds are noise.
+    base = {case["id"]: case for case in baseline["cases"]}
+    rows = []
+    for case in current["cases"]:
+        old = base.get(case["id"])
+        if old is None:
+            continue
+        # The fastest run is the least disturbed by whatever else the machine was doing
+        new_s, old_s = min(case["runs"]), min(old["runs"])
+        ratio = new_s / old_s if old_s > 0 else np.nan
+        flags = []
+        if max(new_s, old_s) >= min_seconds:
+            if ratio > 1 + threshold:
+                flags.append("slower")
+            elif ratio < 1 / (1 + threshold):
+                flags.append("faster")
+        if old.get("rss_delta_mb") is not None and case.get("rss_delta_mb") is not None:
+            # Deltas of a few MB are allocator noise
+            if case["rss_delta_mb"] > max(old["rss_delta_mb"] * (1 + threshold), old["rss_delta_mb"] + 10):
+                flags.append("more memory")
+        for model, metrics in case.get("accuracy", {}).items():
+            old_mape = old.get("accuracy", {}).get(model, {}).get("MAPE")
+            if old_mape is not None and metrics["MAPE"] > old_mape + accuracy_tolerance:
+                flags.append(f"{model} less accurate")
+        rows.append({
+            "id": case["id"],
+            "baseline_s": old_s,
+            "current_s": new_s,
+            "ratio": ratio,
+            "baseline_rss_mb": old.get("rss_delta_mb"),
+            "current_rss_mb": case.get("rss_delta_mb"),
+            "flags": ", ".join(flags),
+        })
+    # Explicit columns keep the report well-formed when the two runs share no cases
+    return pd.DataFrame(rows, columns=["id", "baseline_s", "current_s", "ratio", "baseline_rss_mb", "current_rss_mb", "flags"])
+
+
+def _print_case(case):
+    extra = ""
+    if "accuracy" in case:
+        extra = " MAPE " + ", ".join(f"{model}={metrics['MAPE']:.4f}" for model, metrics in case["accuracy"].items())
+    print(f"{case['id']:<48} {case['seconds'] * 1000:>10.1f} ms  peak {case['peak_rss_mb']:>7.1f} MB  "
+          f"+{case['rss_delta_mb']:.1f} MB{extra}", file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark loading, preprocessing, model fitting and plotting.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    run = subparsers.add_parser("run", help="Run the suite and write the results as JSON")
+    run.add_argument("output", help="JSON file to write results to")
+    run.add_argument("--datasets", nargs="+", default=list(DATASETS), choices=list(DATASETS))
+    run.add_argument("--rows", type=int, nargs="*", default=[10 ** 3, 10 ** 4, 10 ** 5, 10 ** 6],
+                     help="Raw row counts to scale the first dataset to, up to 10**7")
+    run.add_argument("--lengths", type=int, nargs="*", default=[1000],
+                     help="Series lengths to scale the first dataset to for model fitting")
+    run.add_argument("--series", type=int, default=20, help="Synthetic series for the batch case, 0 to skip")
+    run.add_argument("--native-series", type=int, default=2000,
+                     help="Synthetic series for the batched Holt-Winters engine case, 0 to skip")
+    run.add_argument("--series-length", type=int, default=120)
+    run.add_argument("--repeat", type=int, default=3)
+    run.add_argument("--processes", type=int, default=None)
+    cmp = subparsers.add_parser("compare", help="Compare two result files and flag regressions")
+    cmp.add_argument("baseline")
+    cmp.add_argument("current")
+    cmp.add_argument("--threshold", type=float, default=0.2, help="Relative slowdown or memory growth to flag")
+    cmp.add_argument("--min-seconds", type=float, default=0.02, help="Ignore timing changes of cases faster than this")
+    cmp.add_argument("--accuracy-tolerance", type=float, default=0.01, help="Absolute MAPE increase to flag")
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        results = run_suite(args.datasets, args.rows, args.lengths, args.series, args.series_length, args.repeat,
+                            args.processes, on_case=_print_case, native_series=args.native_series)
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=1, default=float)
+        print(f"Wrote {len(results['cases'])} cases to {args.output}", file=sys.stderr)
+        return
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    report = compare(baseline, current, args.threshold, args.min_seconds, args.accuracy_tolerance)
+    with pd.option_context("display.max_rows", None, "display.width", 200):
+        print(report.to_string(index=False, float_format=lambda x: f"{x:.3f}"))
+    regressions = report[report["flags"].str.contains("slower|more memory|less accurate")]
+    print(f"\n{len(regressions)} of {len(report)} cases regressed")
+    sys.exit(1 if len(regressions) else 0)
+
+
+if __name__ == "__main__":
+    main()
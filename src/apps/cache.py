@@ -0,0 +1,321 @@
+import hashlib
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from apps.series import CompactSeries
+
+_MISSING = object()
+
+
+def series_hash(series):
+    # Content hash of values, index and name, stable across reruns and processes
+    h = hashlib.sha256()
+    if isinstance(series, CompactSeries):
+        # The index is fully described by its start and frequency
+        h.update(np.ascontiguousarray(series.values).tobytes())
+        h.update(repr((series.start, series.freqstr, series.dtype.str)).encode())
+        h.update(repr(series.name).encode())
+        return h.hexdigest()
+    h.update(pd.util.hash_pandas_object(series, index=True).values.tobytes())
+    h.update(repr(series.name).encode())
+    h.update(repr(getattr(series.index, "freqstr", None)).encode())
+    return h.hexdigest()
+
+
+def fit_key(kind, series, **config):
+    h = hashlib.sha256()
+    h.update(kind.encode())
+    h.update(series_hash(series).encode())
+    h.update(repr(sorted(config.items())).encode())
+    return h.hexdigest()
+
+
+def evict_oldest_files(directory, suffix, max_entries, key=os.path.getmtime):
+    files = [os.path.join(directory, name) for name in os.listdir(directory) if name.endswith(suffix)]
+    if len(files) <= max_entries:
+        return 0
+    files.sort(key=key)
+    removed = 0
+    for path in files[:len(files) - max_entries]:
+        try:
+            os.remove(path)
+            removed += 1
+        except OSError:
+            pass
+    return removed
+
+
+class FileBackend:
+    # One pickle per key. mtime is the write time (for the TTL) and atime the last read (for eviction)
+    def __init__(self, directory, max_entries=256):
+        self.directory = directory
+        self.max_entries = max_entries
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.pkl")
+
+    def load(self, key):
+        # (value, created) or None
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                value = pickle.load(f)
+            created = os.path.getmtime(path)
+            os.utime(path, (time.time(), created))
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+            return None
+        return value, created
+
+    def store(self, key, value):
+        path = self._path(key)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp, "wb") as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, path)
+        except (OSError, pickle.PicklingError, TypeError, AttributeError):
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            return 0
+        return evict_oldest_files(self.directory, ".pkl", self.max_entries, key=os.path.getatime)
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+
+class SQLiteBackend:
+    # A single SQLite file that several server processes can share; WAL lets readers run alongside a writer
+    def __init__(self, path, max_entries=256):
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._connection() as db:
+            db.execute("CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, value BLOB NOT NULL, "
+                       "created REAL NOT NULL, accessed REAL NOT NULL)")
+            db.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)")
+
+    def _connection(self):
+        # sqlite3 connections cannot be shared between threads, Streamlit runs each session on its own
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30)
+            db.execute("PRAGMA journal_mode=WAL")
+            self._local.db = db
+        return db
+
+    def load(self, key):
+        db = self._connection()
+        try:
+            row = db.execute("SELECT value, created FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            with db:
+                db.execute("UPDATE entries SET accessed = ? WHERE key = ?", (time.time(), key))
+            return pickle.loads(row[0]), row[1]
+        except (sqlite3.Error, pickle.UnpicklingError, EOFError, AttributeError):
+            return None
+
+    def store(self, key, value):
+        try:
+            blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        except (pickle.PicklingError, TypeError, AttributeError):
+            return 0
+        now = time.time()
+        db = self._connection()
+        try:
+            with db:
+                db.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)", (key, blob, now, now))
+                removed = db.execute("DELETE FROM entries WHERE key NOT IN "
+                                     "(SELECT key FROM entries ORDER BY accessed DESC LIMIT ?)", (self.max_entries,))
+            return removed.rowcount
+        except sqlite3.Error:
+            return 0
+
+    def delete(self, key):
+        db = self._connection()
+        try:
+            with db:
+                db.execute("DELETE FROM entries WHERE key = ?", (key,))
+        except sqlite3.Error:
+            pass
+
+
+class _Flight:
+    # One in-progress computation that other callers of the same key wait on
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+    def wait(self, timeout=None):
+        # The value, None if the owner gave up without a result, or the owner's exception
+        if not self.done.wait(timeout):
+            raise TimeoutError("Timed out waiting for the same computation in another session")
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+
+class FitCache:
+    # LRU of results in memory, optionally backed by a directory of pickles (directory=) or a SQLite file
+    # (db_path=) that other processes can read. Entries older than ``ttl`` seconds are dropped. claim()
+    # and get_or_fit() make concurrent callers of one key share a single computation
+    def __init__(self, max_entries=32, directory=None, max_disk_entries=256, ttl=None, db_path=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.backend = None
+        if db_path:
+            self.backend = SQLiteBackend(db_path, max_disk_entries)
+        elif directory:
+            self.backend = FileBackend(directory, max_disk_entries)
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.waits = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._entries = OrderedDict()
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _expired(self, created):
+        return self.ttl is not None and time.time() - created > self.ttl
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._entries:
+                value, created = self._entries[key]
+                if not self._expired(created):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+                self.expirations += 1
+        loaded = self.backend.load(key) if self.backend else None
+        if loaded is not None and self._expired(loaded[1]):
+            self.backend.delete(key)
+            with self._lock:
+                self.expirations += 1
+            loaded = None
+        if loaded is None:
+            with self._lock:
+                self.misses += 1
+            return default
+        with self._lock:
+            self.hits += 1
+            self.disk_hits += 1
+        self._remember(key, *loaded)
+        return loaded[0]
+
+    def put(self, key, value):
+        self._remember(key, value, time.time())
+        if self.backend:
+            removed = self.backend.store(key, value)
+            with self._lock:
+                self.evictions += removed
+        self._land(key, value=value)
+
+    def claim(self, key):
+        # None when the caller should compute ``key`` (and then put() or release() it), otherwise the
+        # flight of the caller already computing it
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is None:
+                self._flights[key] = _Flight()
+                return None
+            self.waits += 1
+            return flight
+
+    def release(self, key, error=None):
+        # Gives up a claim without a result; waiters get ``error`` or, without one, retry themselves
+        self._land(key, error=error)
+
+    def _land(self, key, value=None, error=None):
+        with self._lock:
+            flight = self._flights.pop(key, None)
+        if flight is not None:
+            flight.value, flight.error = value, error
+            flight.done.set()
+
+    def get_or_fit(self, key, func, *args, **kwargs):
+        while True:
+            value = self.get(key, _MISSING)
+            if value is not _MISSING:
+                return value
+            flight = self.claim(key)
+            if flight is None:
+                break
+            value = flight.wait()
+            if value is not None:
+                return value
+        try:
+            value = func(*args, **kwargs)
+        except BaseException as e:
+            self.release(key, e if isinstance(e, Exception) else None)
+            raise
+        self.put(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else None,
+                "shared_waits": self.waits,
+                "in_flight": len(self._flights),
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+    def _remember(self, key, value, created):
+        with self._lock:
+            self._entries[key] = (value, created)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def shared_cache():
+    # One cache for every session of this server process. SHARED_CACHE_DB (SQLite) or FIT_CACHE_DIR
+    # (pickles) also share results between processes; SHARED_CACHE_TTL expires entries after that many seconds
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            ttl = os.environ.get("SHARED_CACHE_TTL")
+            _shared = FitCache(
+                max_entries=int(os.environ.get("SHARED_CACHE_ENTRIES", 128)),
+                directory=os.environ.get("FIT_CACHE_DIR"),
+                max_disk_entries=int(os.environ.get("SHARED_CACHE_DISK_ENTRIES", 256)),
+                ttl=float(ttl) if ttl else None,
+                db_path=os.environ.get("SHARED_CACHE_DB"),
+            )
+        return _shared
@@ -1,15 +1,226 @@
+import json
+import os
+import tempfile
+import time
+import uuid
 import streamlit as st
-from apps.utils import load_data, preprocess_data, train_test_split, sarimax_forecast, holt_winters_forecast, calculate_kpis
-from apps.visualizations import plot_forecasts, plot_decomposition, plot_mape,plot_acf_pacf,plot_entire_data
+from apps.cache import shared_cache, fit_key
+from apps.utils import (load_data, load_preview, load_series_chunked, train_test_split, sarimax_forecast, quick_sarimax_forecast,
+                        holt_winters_forecast, calculate_kpis, read_progress, shared_pool, FitCancelled, JobTimeout, QUANTILES)
+from apps.backtest import backtest, summarize_backtest
+from apps.incremental import append_observations
+from apps.order_search import search_orders
+from apps.profiling import Profiler, active_profiler, span
+from apps.series import CompactSeries
+from apps.store import SeriesStore
+from apps.visualizations import plot_forecasts, plot_decomposition, plot_mape,plot_acf_pacf,plot_entire_data, decompose, plot_backtest, MAX_POINTS
+
+FIT_TIMEOUT = float(os.environ.get("FIT_TIMEOUT", 300))
+# Processes for background SARIMAX estimation, shared by all sessions on top of the WORKER_PROCESSES fit pool
+REFINE_PROCESSES = int(os.environ.get("REFINE_PROCESSES", 0)) or max(1, (os.cpu_count() or 1) // 2)
+# When set, every profiled run also writes a Chrome trace JSON file here
+PROFILE_DIR = os.environ.get("PROFILE_DIR")
+
+def get_fit_cache():
+    # Shared by every session of this process, so analysts opening the same data and models fit them once
+    return shared_cache()
+
+def get_worker_pool():
+    # One pool for every session of this process; a session that reruns mid-fit drops its results
+    # instead of terminating workers that other sessions are using
+    return shared_pool("fit")
+
+def fit_models(fit_cache, jobs):
+    # jobs maps a name to (cache key, func, args); only cache misses are sent to the worker pool, and a
+    # miss another session is already fitting is waited on instead of fitted twice
+    values = {name: fit_cache.get(key) for name, (key, func, args) in jobs.items()}
+    missing = [name for name in jobs if values[name] is None]
+    if not missing:
+        return values
+
+    flights = {name: fit_cache.claim(jobs[name][0]) for name in missing}
+    owned = {name: jobs[name][1:] for name in missing if flights[name] is None}
+    status = st.empty()
+    results = {}
+    try:
+        if owned:
+            profiler = active_profiler()
+            results = get_worker_pool().run(
+                owned,
+                timeout=FIT_TIMEOUT,
+                on_wait=lambda elapsed, pending: status.caption(f"Fitting {', '.join(pending)}... {elapsed:.1f}s"),
+                profile=profiler.memory if profiler else None,
+                # Jobs this run gave up on still fill the cache if they finish before noticing the cancellation
+                on_late=lambda name, value: fit_cache.put(jobs[name][0], value),
+            )
+            if profiler:
+                for result in results.values():
+                    profiler.extend(result.spans or [])
+            for name, result in results.items():
+                if result.error is None:
+                    fit_cache.put(jobs[name][0], result.value)
+                    values[name] = result.value
+                else:
+                    fit_cache.release(jobs[name][0], result.error)
+    finally:
+        # Interrupted by a rerun: let waiting sessions fit these themselves
+        for name in owned:
+            if name not in results:
+                fit_cache.release(jobs[name][0])
+
+    failed = {name: result.error for name, result in results.items() if result.error is not None}
+    retry = {}
+    for name in missing:
+        if flights[name] is None:
+            continue
+        status.caption(f"Waiting for {name}, another session is fitting the same model...")
+        try:
+            value = flights[name].wait(FIT_TIMEOUT)
+        except Exception as e:
+            failed[name] = e
+            continue
+        if value is None:
+            retry[name] = jobs[name]
+        else:
+            values[name] = value
+    timings = [f"{name}: {result.seconds:.2f}s" for name, result in results.items()]
+    timings += [f"{name}: shared" for name in missing if flights[name] is not None and values[name] is not None]
+    status.caption(" | ".join(timings))
+
+    for name, error in failed.items():
+        st.error(f"{name} failed: {error}")
+    if failed:
+        st.stop()
+    if retry:
+        values.update(fit_models(fit_cache, retry))
+    return values
+
+def get_refine_pool():
+    # Low-priority processes for background SARIMAX estimation, shared by all sessions, so long fits queue
+    # behind each other and yield the CPU to interactive fits instead of each session adding a process.
+    # A single likelihood evaluation of a daily seasonal model can take minutes, so the fits run in
+    # processes that are killed when cancelled instead of waiting for a cancellation check
+    return shared_pool("refine", processes=REFINE_PROCESSES, nice=10, killable=True)
+
+def refine_sarimax(fit_cache, key, args, time_budget):
+    # Starts or polls the background fit for ``key``; returns its result once finished and None while it
+    # queues or runs. A fit for other inputs is cancelled, and one that overruns its budget by far is dropped
+    job = st.session_state.get('sarimax_refine')
+    if job is not None and job['key'] != key:
+        discard_refine(job)
+        job = None
+    if job is None:
+        if st.session_state.get('sarimax_refine_failed') == key:
+            return None
+        progress_path = os.path.join(tempfile.gettempdir(), f"sarimax-progress-{uuid.uuid4().hex}.json")
+        job = {
+            'key': key,
+            'budget': time_budget,
+            'progress_path': progress_path,
+        }
+        # The pool kills the fit at the same deadline should this session go away before it polls again
+        job['result'] = get_refine_pool().submit(sarimax_forecast, args, {'time_budget': time_budget, 'progress_path': progress_path},
+                                                 deadline=refine_deadline(job))
+        st.session_state['sarimax_refine'] = job
+        st.session_state.pop('sarimax_refine_failed', None)
+
+    elapsed = job['result'].elapsed()
+    if not job['result'].ready() and (elapsed is None or elapsed < refine_deadline(job)):
+        return None
+    discard_refine(job)
+    try:
+        value, _, _ = job['result'].get()
+    except (FitCancelled, JobTimeout):
+        # The budget is checked between optimiser iterations and one iteration took far too long
+        st.session_state['sarimax_refine_failed'] = key
+        st.warning(f"SARIMAX estimation was cancelled after {elapsed:.0f}s; showing the quick fit.")
+        return None
+    except Exception as e:
+        st.session_state['sarimax_refine_failed'] = key
+        st.warning(f"SARIMAX estimation failed: {e}; showing the quick fit.")
+        return None
+    fit_cache.put(key, value)
+    return value
+
+def discard_refine(job):
+    # A job still queued or running is killed, which frees its worker for the next fit at once
+    st.session_state.pop('sarimax_refine', None)
+    if not job['result'].ready():
+        job['result'].cancel()
+    if os.path.exists(job['progress_path']):
+        os.remove(job['progress_path'])
+
+def refine_deadline(job):
+    return 2 * job['budget'] + 10
+
+@st.fragment(run_every=1.0)
+def show_refine_progress():
+    # Reruns on its own every second while the rest of the page stays as it is, and reruns the whole
+    # page once the background fit has finished
+    job = st.session_state.get('sarimax_refine')
+    if job is None:
+        return
+    elapsed = job['result'].elapsed()
+    if job['result'].ready() or (elapsed is not None and elapsed >= refine_deadline(job)):
+        st.rerun()
+    if elapsed is None:
+        st.caption("SARIMAX estimation is waiting for a free worker...")
+        return
+    progress = read_progress(job['progress_path'])
+    st.progress(min(elapsed / job['budget'], 1.0),
+                text=f"Estimating SARIMAX: {progress.get('iterations', 0)} iterations, {elapsed:.0f}s of {job['budget']}s")
+
+def apply_best_order(leaderboard):
+    best = leaderboard.iloc[0]
+    st.session_state['sarimax_p'], _, st.session_state['sarimax_q'] = best['order']
+    st.session_state['sarimax_sp'], _, st.session_state['sarimax_sq'], _ = best['seasonal_order']
+
+def plotly_chart(fig, name):
+    # Plotly figures are serialised to JSON inside st.plotly_chart, which can dominate for long series
+    with span("st.plotly_chart", chart=name):
+        st.plotly_chart(fig)
+
+def show_timings(profiler):
+    with st.expander("Timings"):
+        st.dataframe(profiler.to_frame(), hide_index=True)
+        trace = profiler.chrome_trace()
+        if PROFILE_DIR:
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            path = profiler.write_chrome_trace(os.path.join(PROFILE_DIR, f"forecast-{time.strftime('%Y%m%d-%H%M%S')}.json"))
+            st.caption(f"Trace written to {path}")
+        st.download_button("Download Chrome Trace", json.dumps(trace, default=str), file_name="forecast-trace.json", mime="application/json")
 
 def app():
+    # The toggle is drawn at the end of the run, its value is already known when the run starts
+    profiler = Profiler(memory=st.session_state.get('profile_memory', False)) if st.session_state.get('profile_run') else None
+    try:
+        if profiler:
+            with profiler, profiler.span("forecast.app"):
+                forecast_page()
+        else:
+            forecast_page()
+    finally:
+        st.sidebar.markdown("---")
+        st.sidebar.checkbox("Profile this page", key="profile_run")
+        if st.session_state.get('profile_run'):
+            st.sidebar.checkbox("Track memory peaks", key="profile_memory")
+        if profiler and profiler.memory_busy:
+            st.sidebar.caption("Memory tracking busy: another session is tracking memory peaks, this run recorded timings only.")
+        if profiler:
+            show_timings(profiler)
+        stats = shared_cache().stats()
+        st.sidebar.caption(f"Shared cache: {stats['hits']} hits, {stats['misses']} misses, "
+                           f"{stats['shared_waits']} shared with other sessions, {stats['entries']} entries")
+
+def forecast_page():
     st.title("Time Series Forecasting")
+    fit_cache = get_fit_cache()
 
     st.sidebar.header("Upload and Configure Data")
     st.sidebar.markdown("[Download Sample Datasets](https://github.com/dibyendutapadar/time-series-forecasting/tree/cd2f848fce49ece37a0dc3235449532075d9c9bf/sample%20data%20sets)")
     uploaded_file = st.sidebar.file_uploader("Upload your CSV file", type=["csv"])
     if uploaded_file:
-        df = load_data(uploaded_file)
+        df = load_preview(uploaded_file)
 
         if df is not None:
             st.subheader("Data Preview")
@@ -21,13 +232,32 @@ def app():
             frequency = st.sidebar.selectbox("Select Frequency", ["D", "W", "M", "Q", "Y"])
 
             if st.sidebar.button("Submit"):
-                df = preprocess_data(df, date_col, target_col, date_format, frequency)
-                st.session_state['df'] = df
+                with span("load series"):
+                    series = SeriesStore().get_or_load(uploaded_file, date_col, target_col, date_format, frequency,
+                                                       load_series_chunked, cache=fit_cache)
+                st.session_state['series'] = series
                 st.session_state['date_col'] = date_col
                 st.session_state['target_col'] = target_col
-
-    if 'df' in st.session_state:
-        df = st.session_state['df']
+                st.session_state['date_format'] = date_format
+                st.session_state['frequency'] = frequency
+                # The stored series does not know its last raw timestamp, so the first append skips stored buckets
+                st.session_state['last_seen'] = None
+
+    if 'series' in st.session_state and 'frequency' in st.session_state:
+        new_file = st.sidebar.file_uploader("Append New Observations", type=["csv"])
+        if new_file and st.sidebar.button("Append"):
+            # Only the new rows are preprocessed and folded into the stored series
+            df, added, revised, st.session_state['last_seen'] = append_observations(
+                st.session_state['series'].to_frame(), load_data(new_file), st.session_state['date_col'],
+                st.session_state['target_col'], st.session_state['date_format'], st.session_state['frequency'],
+                st.session_state.get('last_seen'),
+            )
+            st.session_state['series'] = CompactSeries.from_series(df[st.session_state['target_col']])
+            st.sidebar.success(f"Added {added} and revised {revised} observations")
+
+    if 'series' in st.session_state:
+        # Values plus start and frequency; train and test below are views of the same array
+        series = st.session_state['series']
         date_col = st.session_state['date_col']
         target_col = st.session_state['target_col']
 
@@ -35,15 +265,22 @@ def app():
 
 
         st.subheader("Entire Data Plot")
-        fig_entire_data = plot_entire_data(df, date_col, target_col)
-        st.plotly_chart(fig_entire_data)
+        window = None
+        if len(series) > MAX_POINTS:
+            # Plotly zooms on the client with the downsampled points, this re-queries at full detail
+            start, end = series.start.to_pydatetime(), series.end.to_pydatetime()
+            window = st.slider("Zoom", min_value=start, max_value=end, value=(start, end), format="YYYY-MM-DD")
+        fig_entire_data = plot_entire_data(series, date_col, target_col, window)
+        plotly_chart(fig_entire_data, "Entire Data")
 
         st.subheader("ACF and PACF Plots")
-        st.plotly_chart(plot_acf_pacf(df[target_col]))
+        # Lags cover two cycles of the seasonal period chosen for SARIMAX on the previous run
+        plotly_chart(plot_acf_pacf(series, st.session_state.get('sarimax_s')), "ACF and PACF")
 
 
 
         test_size = st.slider("Test Size", 0.1, 0.5, 0.2)
+        train, test = train_test_split(series, test_size)
 
         st.header("SARIMAX Model")
         with st.expander("SARIMAX Models Explanation"):
@@ -85,40 +322,79 @@ def app():
 
         st.subheader("Configure")
 
+        for key, default in [('sarimax_p', 1), ('sarimax_d', 1), ('sarimax_q', 1), ('sarimax_sp', 1), ('sarimax_sd', 1), ('sarimax_sq', 1), ('sarimax_s', 12)]:
+            st.session_state.setdefault(key, default)
+
         # Create the first row with 3 columns
         col1, col2, col3 = st.columns(3)
 
         with col1:
-            p = st.number_input("Order p", min_value=0, max_value=10, value=1)
+            p = st.number_input("Order p", min_value=0, max_value=10, key="sarimax_p")
 
         with col2:
-            d = st.number_input("Order d", min_value=0, max_value=10, value=1)
+            d = st.number_input("Order d", min_value=0, max_value=10, key="sarimax_d")
 
         with col3:
-            q = st.number_input("Order q", min_value=0, max_value=10, value=1)
+            q = st.number_input("Order q", min_value=0, max_value=10, key="sarimax_q")
         # Create the second row with 5 columns
         col4, col5, col6, col7 = st.columns(4)
 
         with col4:
-            sp = st.number_input("Seasonal Order p", min_value=0, max_value=10, value=1)
+            sp = st.number_input("Seasonal Order p", min_value=0, max_value=10, key="sarimax_sp")
 
         with col5:
-            sd = st.number_input("Seasonal Order d", min_value=0, max_value=10, value=1)
+            sd = st.number_input("Seasonal Order d", min_value=0, max_value=10, key="sarimax_sd")
 
         with col6:
-            sq = st.number_input("Seasonal Order q", min_value=0, max_value=10, value=1)
+            sq = st.number_input("Seasonal Order q", min_value=0, max_value=10, key="sarimax_sq")
 
         with col7:
-            s = st.number_input("Seasonal Period s", min_value=1, max_value=365, value=12)
-
-
-
-        train, test = train_test_split(df, test_size)
-        sarimax_pred = sarimax_forecast(train[target_col], test[target_col], (p, d, q), (sp, sd, sq, s))
-
-
-        st.subheader("SARIMAX Forecast")
-        st.plotly_chart(plot_forecasts(train[target_col], test[target_col], sarimax_pred, method="SARIMAX"))
+            s = st.number_input("Seasonal Period s", min_value=1, max_value=365, key="sarimax_s")
+
+        col_progressive, col_budget = st.columns(2)
+        with col_progressive:
+            progressive = st.checkbox("Progressive fitting", value=True,
+                                      help="Show a quick fit from start parameters at once and estimate the model in the background")
+        with col_budget:
+            sarimax_budget = st.number_input("Time Budget (s)", min_value=1, max_value=int(FIT_TIMEOUT), value=min(60, int(FIT_TIMEOUT)),
+                                             help="The background estimate stops here and keeps the best parameters found so far")
+
+
+
+        with st.expander("Search Orders"):
+            st.write("Rank candidate p, q, P and Q orders on the training data, keeping d, D and s from above.")
+            col_a, col_b, col_c, col_d = st.columns(4)
+            with col_a:
+                criterion = st.selectbox("Criterion", ["aic", "mae"], format_func=lambda c: {"aic": "AIC", "mae": "Holdout MAE"}[c])
+            with col_b:
+                max_order = st.number_input("Max p, q", min_value=0, max_value=10, value=3)
+            with col_c:
+                max_seasonal_order = st.number_input("Max P, Q", min_value=0, max_value=10, value=1)
+            with col_d:
+                max_models = st.number_input("Max Models", min_value=1, max_value=500, value=30)
+            stepwise = st.checkbox("Stepwise search", value=True)
+
+            search_key = fit_key("order_search", train, d=d, sd=sd, s=s, criterion=criterion,
+                                 max_order=max_order, max_seasonal_order=max_seasonal_order, max_models=max_models, stepwise=stepwise)
+            if st.button("Run Search"):
+                progress = st.progress(0.0)
+                with span("search_orders"):
+                    leaderboard = search_orders(
+                        train, d, sd, s, criterion=criterion, max_order=max_order,
+                        max_seasonal_order=max_seasonal_order, stepwise=stepwise, max_models=max_models,
+                        time_budget=FIT_TIMEOUT, pool=get_worker_pool(),
+                        on_progress=lambda done, total, elapsed: progress.progress(min(done / total, 1.0), text=f"{done} models fitted in {elapsed:.1f}s"),
+                    )
+                st.session_state['order_search'] = (search_key, leaderboard)
+
+            if st.session_state.get('order_search', (None,))[0] == search_key:
+                leaderboard = st.session_state['order_search'][1]
+                st.dataframe(leaderboard.astype({"order": str, "seasonal_order": str}))
+                if len(leaderboard) and leaderboard['error'].isna().iloc[0]:
+                    st.button("Use Best Order", on_click=apply_best_order, args=(leaderboard,))
+
+        # Filled in once all models are fitted, the fits run concurrently below
+        sarimax_section = st.container()
        
         st.markdown("---")
 
@@ -171,18 +447,89 @@ def app():
         with col10:    
             seasonal_periods = st.number_input("Seasonal Periods", min_value=1, max_value=365, value=12)
         
-        hw_model, hw_pred = holt_winters_forecast(train[target_col], test[target_col], trend, seasonal, seasonal_periods)
+        sarimax_args = (train, test, (p, d, q), (sp, sd, sq, s), QUANTILES)
+        sarimax_key = fit_key("sarimax", train, steps=len(test), order=(p, d, q), seasonal_order=(sp, sd, sq, s), quantiles=QUANTILES,
+                              time_budget=sarimax_budget if progressive else None)
+        hw_key = fit_key("holt_winters", train, steps=len(test), trend=trend, seasonal=seasonal, seasonal_periods=seasonal_periods,
+                         quantiles=QUANTILES)
+        jobs = {
+            "Holt-Winters": (hw_key, holt_winters_forecast, (train, test, trend, seasonal, seasonal_periods, QUANTILES)),
+            "Decomposition": (
+                fit_key("decomposition", train, seasonal_periods=seasonal_periods),
+                decompose, (train, seasonal_periods),
+            ),
+        }
+        sarimax_fit = fit_cache.get(sarimax_key) if progressive else None
+        if not progressive:
+            jobs["SARIMAX"] = (sarimax_key, sarimax_forecast, sarimax_args)
+        elif sarimax_fit is None:
+            sarimax_quick_key = fit_key("sarimax_quick", train, steps=len(test), order=(p, d, q), seasonal_order=(sp, sd, sq, s), quantiles=QUANTILES)
+            jobs["SARIMAX (quick)"] = (sarimax_quick_key, quick_sarimax_forecast, sarimax_args)
+        with span("fit_models"):
+            fits = fit_models(fit_cache, jobs)
+        if progressive and sarimax_fit is None:
+            sarimax_fit = refine_sarimax(fit_cache, sarimax_key, sarimax_args, sarimax_budget)
+        if sarimax_fit is None and "SARIMAX (quick)" in fits:
+            sarimax_fit, sarimax_result_key = fits["SARIMAX (quick)"], sarimax_quick_key
+        else:
+            sarimax_fit, sarimax_result_key = sarimax_fit or fits["SARIMAX"], sarimax_key
+        sarimax_pred, sarimax_bands = sarimax_fit
+        hw_model, hw_pred, hw_bands = fits["Holt-Winters"]
+
+        with sarimax_section:
+            st.subheader("SARIMAX Forecast")
+            if sarimax_result_key != sarimax_key and st.session_state.get('sarimax_refine_failed') == sarimax_key:
+                st.caption("Quick fit from start parameters, without likelihood optimisation. Estimating the model did not "
+                           "finish; change the inputs or untick Progressive fitting to try again.")
+            elif sarimax_result_key != sarimax_key:
+                st.caption("Quick fit from start parameters, without likelihood optimisation. The estimated model replaces it when ready.")
+                if 'sarimax_refine' in st.session_state:
+                    show_refine_progress()
+            elif sarimax_pred.attrs.get("fit", {}).get("budget_exceeded"):
+                st.caption(f"Estimation stopped at the {sarimax_budget}s time budget after {sarimax_pred.attrs['fit']['iterations']} "
+                           "iterations; showing the best parameters found so far.")
+            plotly_chart(plot_forecasts(train, test, sarimax_pred, method="SARIMAX", bands=sarimax_bands), "SARIMAX Forecast")
 
         st.subheader("Holt-Winters Decomposition")
 
-        st.pyplot(plot_decomposition(train[target_col], seasonal_periods))
+        fig_decomposition = plot_decomposition(train, seasonal_periods, fits["Decomposition"])
+        with span("st.pyplot", chart="Decomposition"):
+            st.pyplot(fig_decomposition)
 
         st.subheader("Holt-Winters Forecast")
-        st.plotly_chart(plot_forecasts(train[target_col], test[target_col], hw_pred, method="Holt-Winters"))
+        plotly_chart(plot_forecasts(train, test, hw_pred, method="Holt-Winters", bands=hw_bands), "Holt-Winters Forecast")
 
         st.subheader("KPIs")
-        kpis = calculate_kpis(test[target_col], sarimax_pred, hw_pred)
+        kpis = fit_cache.get_or_fit(fit_key("kpis", test, sarimax=sarimax_result_key, holt_winters=hw_key),
+                                    calculate_kpis, test, sarimax_pred, hw_pred, sarimax_bands, hw_bands)
         st.write(kpis)
 
         st.subheader("MAPE Comparison")
-        st.plotly_chart(plot_mape(kpis))
+        plotly_chart(plot_mape(kpis), "MAPE Comparison")
+
+        st.subheader("Rolling-Origin Backtest")
+        with st.expander("Backtest"):
+            st.write("Evaluate both models across many forecast origins instead of a single holdout split. Parameters are estimated once and reused at every origin unless Refit is ticked.")
+            col11, col12, col13, col14 = st.columns(4)
+            with col11:
+                bt_horizon = st.number_input("Horizon", min_value=1, max_value=max(1, len(series) // 2), value=min(12, max(1, len(series) // 4)))
+            with col12:
+                bt_step = st.number_input("Step", min_value=1, max_value=max(1, len(series)), value=1)
+            with col13:
+                bt_window = st.number_input("Sliding Window (0 = expanding)", min_value=0, max_value=len(series), value=0)
+            with col14:
+                bt_refit = st.checkbox("Refit every origin", value=False)
+
+            bt_key = fit_key("backtest", series, initial=len(train), horizon=bt_horizon, step=bt_step, window=bt_window, refit=bt_refit,
+                             order=(p, d, q), seasonal_order=(sp, sd, sq, s), trend=trend, seasonal=seasonal, seasonal_periods=seasonal_periods)
+            if st.button("Run Backtest"):
+                with st.spinner("Backtesting..."), span("backtest"):
+                    folds = backtest(series, bt_horizon, initial=len(train), step=bt_step, window=bt_window or None,
+                                     refit=bt_refit, order=(p, d, q), seasonal_order=(sp, sd, sq, s), trend=trend,
+                                     seasonal=seasonal, seasonal_periods=seasonal_periods, pool=get_worker_pool())
+                st.session_state['backtest'] = (bt_key, folds)
+
+            if st.session_state.get('backtest', (None,))[0] == bt_key:
+                folds = st.session_state['backtest'][1]
+                st.write(summarize_backtest(folds))
+                plotly_chart(plot_backtest(folds), "Backtest")
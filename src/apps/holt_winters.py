@@ -0,0 +1,312 @@
+import math
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from apps.series import as_series
+
+
+def fixed_params(model_fit):
+    # Model and fit kwargs that replay a fitted ExponentialSmoothing with its parameters held fixed
+    params = model_fit.params
+    model = model_fit.model
+    model_kwargs = {
+        "trend": model.trend,
+        "seasonal": model.seasonal,
+        "seasonal_periods": model.seasonal_periods,
+        "initialization_method": "known",
+        "initial_level": params["initial_level"],
+    }
+    fit_kwargs = {"smoothing_level": params["smoothing_level"], "optimized": False}
+    if model.trend:
+        model_kwargs["initial_trend"] = params["initial_trend"]
+        fit_kwargs["smoothing_trend"] = params["smoothing_trend"]
+    if model.seasonal:
+        model_kwargs["initial_seasonal"] = params["initial_seasons"]
+        fit_kwargs["smoothing_seasonal"] = params["smoothing_seasonal"]
+    return model_kwargs, fit_kwargs
+
+
+def refilter(series, model_kwargs, fit_kwargs):
+    # One smoothing pass over ``series`` with parameters and initial states taken from fixed_params
+    from statsmodels.tsa.holtwinters import ExponentialSmoothing
+    return ExponentialSmoothing(as_series(series), **model_kwargs).fit(**fit_kwargs)
+
+
+def states_at(model_fit, origins):
+    # Level, trend and last season of states after observing ``origins`` points (one row per origin)
+    origins = np.asarray(origins)
+    level = model_fit.level.to_numpy()[origins - 1]
+    trend = model_fit.trend.to_numpy()[origins - 1] if model_fit.model.trend else None
+    season = None
+    if model_fit.model.seasonal:
+        m = model_fit.model.seasonal_periods
+        season = model_fit.season.to_numpy()[origins[:, None] - m + np.arange(m)]
+    return level, trend, season
+
+
+def forecast_from_states(level, trend, season, horizon, trend_type, seasonal_type):
+    # Vectorised h-step forecasts for a batch of states: level (k,), trend (k,), season (k, m)
+    h = np.arange(1, horizon + 1)
+    level = np.asarray(level, dtype=float)[:, None]
+    if trend_type == "mul":
+        base = level * np.asarray(trend, dtype=float)[:, None] ** h
+    elif trend_type == "add":
+        base = level + np.asarray(trend, dtype=float)[:, None] * h
+    else:
+        base = np.repeat(level, horizon, axis=1)
+    if seasonal_type is None:
+        return base
+    season = np.asarray(season, dtype=float)
+    seasonal = season[:, (h - 1) % season.shape[1]]
+    return base * seasonal if seasonal_type == "mul" else base + seasonal
+
+
+def smoothing_state(model_fit):
+    # The final states and smoothing parameters, all that is needed to absorb new observations
+    params = model_fit.params
+    model = model_fit.model
+    m = model.seasonal_periods
+    return {
+        "trend": model.trend,
+        "seasonal": model.seasonal,
+        "alpha": params["smoothing_level"],
+        "beta": params["smoothing_trend"] if model.trend else None,
+        "gamma": params["smoothing_seasonal"] if model.seasonal else None,
+        "level": float(model_fit.level.iloc[-1]),
+        "slope": float(model_fit.trend.iloc[-1]) if model.trend else None,
+        "season": model_fit.season.to_numpy()[-m:].copy() if model.seasonal else None,
+        "sigma": math.sqrt(model_fit.sse / model.nobs),
+    }
+
+
+def update_state(state, values):
+    # Runs the smoothing recursion over ``values`` only, returning the new state and the
+    # one-step-ahead forecast errors (same recursion as statsmodels, undamped)
+    state = dict(state)
+    trend, seasonal = state["trend"], state["seasonal"]
+    alpha, beta, gamma = state["alpha"], state["beta"], state["gamma"]
+    level, slope = state["level"], state["slope"]
+    season = list(state["season"]) if seasonal else None
+    errors = np.empty(len(values))
+    for i, y in enumerate(np.asarray(values, dtype=float)):
+        base = level * slope if trend == "mul" else level + slope if trend == "add" else level
+        if seasonal == "mul":
+            s_old = season.pop(0)
+            errors[i] = y - base * s_old
+            new_level = alpha * y / s_old + (1 - alpha) * base
+            season.append(gamma * y / base + (1 - gamma) * s_old)
+        elif seasonal == "add":
+            s_old = season.pop(0)
+            errors[i] = y - (base + s_old)
+            new_level = alpha * (y - s_old) + (1 - alpha) * base
+            season.append(gamma * (y - base) + (1 - gamma) * s_old)
+        else:
+            errors[i] = y - base
+            new_level = alpha * y + (1 - alpha) * base
+        if trend == "mul":
+            slope = beta * new_level / level + (1 - beta) * slope
+        elif trend == "add":
+            slope = beta * (new_level - level) + (1 - beta) * slope
+        level = new_level
+    state.update(level=level, slope=slope, season=np.array(season) if seasonal else None)
+    return state, errors
+
+
+def forecast_state(state, horizon):
+    season = state["season"][None, :] if state["seasonal"] else None
+    slope = [state["slope"]] if state["trend"] else None
+    return forecast_from_states([state["level"]], slope, season, horizon, state["trend"], state["seasonal"])[0]
+
+
+# Batched engine: the same recursion over a (series, time) array, so thousands of series of equal length
+# are smoothed, optimised and forecast with a few NumPy operations per time step instead of one
+# statsmodels model per series.
+
+def initial_states_batch(values, trend, seasonal, seasonal_periods):
+    # Heuristic initialisation of Hyndman et al. (2008), section 2.6, as statsmodels does it, for every row
+    values = np.asarray(values, dtype=float)
+    k, n = values.shape
+    m = seasonal_periods
+    if n < 10:
+        raise ValueError("Cannot use heuristic method with less than 10 observations.")
+    season = None
+    smoothed = values
+    if seasonal:
+        min_obs = 10 + 2 * (m // 2)
+        if n < 2 * m or n < min_obs:
+            raise ValueError(f"Seasonal initialisation needs at least {max(2 * m, min_obs)} observations.")
+        cycles = max(min(5, n // m), int(np.ceil(min_obs / m)))
+        head = pd.DataFrame(values[:, :m * cycles].T)
+        moving = head.rolling(m, center=True).mean()
+        if m % 2 == 0:
+            moving = moving.shift(-1).rolling(2).mean()
+        detrended = (head / moving if seasonal == "mul" else head - moving).to_numpy()
+        padded = np.full((m * cycles, k), np.nan)
+        padded[:len(detrended)] = detrended
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            season = np.nanmean(padded.reshape(cycles, m, k), axis=0).T
+        season = season / season.mean(axis=1, keepdims=True) if seasonal == "mul" else season - season.mean(axis=1, keepdims=True)
+        smoothed = moving.dropna().to_numpy().T
+    design = np.c_[np.ones(10), np.arange(10) + 1]
+    coefs = np.linalg.pinv(design) @ smoothed[:, :10].T
+    level = coefs[0]
+    slope = None
+    if trend == "add":
+        slope = coefs[1]
+    elif trend == "mul":
+        slope = 1 + coefs[1] / coefs[0]
+    return level, slope, season
+
+
+def smooth_batch(values, alpha, beta, gamma, level, slope, season, trend, seasonal):
+    # Runs the recursion of update_state over every row of ``values`` (k, n) at once. Parameters and
+    # initial states are (k,) or (k, c) to try c parameter sets per row without copying the data; the
+    # season has an extra trailing axis of length m. Returns the SSE and the final states, with the
+    # season rotated so that its first entry is the season of the first forecast step.
+    values = np.asarray(values, dtype=float)
+    n = values.shape[1]
+    level = np.array(level, dtype=float)
+    slope = np.array(slope, dtype=float) if trend else None
+    # Time and season position lead so that every step works on contiguous slices
+    season = np.moveaxis(np.array(season, dtype=float), -1, 0).copy() if seasonal else None
+    m = season.shape[0] if seasonal else 1
+    columns = np.ascontiguousarray(values.T).reshape((n, -1) + (1,) * (level.ndim - 1))
+    sse = np.zeros(level.shape)
+    with np.errstate(all="ignore"):
+        for t in range(n):
+            y = columns[t]
+            base = level * slope if trend == "mul" else level + slope if trend == "add" else level
+            if seasonal:
+                s_old = season[t % m]
+                if seasonal == "mul":
+                    error = y - base * s_old
+                    new_level = alpha * y / s_old + (1 - alpha) * base
+                    season[t % m] = gamma * y / base + (1 - gamma) * s_old
+                else:
+                    error = y - (base + s_old)
+                    new_level = alpha * (y - s_old) + (1 - alpha) * base
+                    season[t % m] = gamma * (y - base) + (1 - gamma) * s_old
+            else:
+                error = y - base
+                new_level = alpha * y + (1 - alpha) * base
+            if trend == "mul":
+                slope = beta * new_level / level + (1 - beta) * slope
+            elif trend == "add":
+                slope = beta * (new_level - level) + (1 - beta) * slope
+            level = new_level
+            sse += error * error
+    sse[~np.isfinite(sse)] = np.inf
+    if seasonal:
+        season = np.moveaxis(np.roll(season, -(n % m), axis=0), 0, -1)
+    return sse, level, slope, season
+
+
+def _unit_to_params(unit, trend, seasonal):
+    # Search coordinates in [0, 1]^d mapped to alpha, beta = b * alpha and gamma = g * (1 - alpha),
+    # the usual restrictions that keep the smoothing weights admissible
+    alpha = unit[..., 0]
+    column = 1
+    beta = gamma = None
+    if trend:
+        beta = unit[..., column] * alpha
+        column += 1
+    if seasonal:
+        gamma = unit[..., column] * (1 - alpha)
+    return alpha, beta, gamma
+
+
+def fit_batch(values, trend, seasonal, seasonal_periods, grid=5, rounds=8, bound=1e-4):
+    # Fits one Holt-Winters model per row of ``values`` (k, n). The smoothing parameters of all rows are
+    # optimised together: every row evaluates a coarse grid, then a local grid around its best point
+    # that halves in size each round. Returns a state dict like smoothing_state with one entry per row.
+    values = np.asarray(values, dtype=float)
+    k, n = values.shape
+    if (trend == "mul" or seasonal == "mul") and (values <= 0).any():
+        raise ValueError("Multiplicative trend or seasonality requires strictly positive values")
+    level0, slope0, season0 = initial_states_batch(values, trend, seasonal, seasonal_periods)
+    dims = 1 + bool(trend) + bool(seasonal)
+
+    def sse_of(candidates):
+        # candidates (k, c, dims): every row evaluates its own c candidates in one pass
+        c = candidates.shape[1]
+        alpha, beta, gamma = _unit_to_params(candidates, trend, seasonal)
+        sse, *_ = smooth_batch(
+            values, alpha, beta, gamma, np.repeat(level0[:, None], c, axis=1),
+            np.repeat(slope0[:, None], c, axis=1) if trend else None,
+            np.repeat(season0[:, None, :], c, axis=1) if seasonal else None, trend, seasonal,
+        )
+        return sse
+
+    axis = np.linspace(bound, 1 - bound, grid)
+    coarse = np.stack(np.meshgrid(*[axis] * dims, indexing="ij"), axis=-1).reshape(-1, dims)
+    sse = sse_of(np.broadcast_to(coarse, (k,) + coarse.shape))
+    best_index = np.argmin(sse, axis=1)
+    best, best_sse = coarse[best_index], sse[np.arange(k), best_index]
+
+    offsets = np.stack(np.meshgrid(*[[-1.0, 0.0, 1.0]] * dims, indexing="ij"), axis=-1).reshape(-1, dims)
+    step = (axis[1] - axis[0]) / 2
+    for _ in range(rounds):
+        candidates = np.clip(best[:, None, :] + step * offsets[None, :, :], bound, 1 - bound)
+        sse = sse_of(candidates)
+        best_index = np.argmin(sse, axis=1)
+        # The centre is a candidate, so the SSE never gets worse
+        best, best_sse = candidates[np.arange(k), best_index], sse[np.arange(k), best_index]
+        step /= 2
+
+    alpha, beta, gamma = _unit_to_params(best, trend, seasonal)
+    _, level, slope, season = smooth_batch(values, alpha, beta, gamma, level0, slope0, season0, trend, seasonal)
+    return {
+        "trend": trend,
+        "seasonal": seasonal,
+        "alpha": alpha,
+        "beta": beta,
+        "gamma": gamma,
+        "level": level,
+        "slope": slope,
+        "season": season,
+        "sigma": np.sqrt(best_sse / n),
+        "initial_level": level0,
+        "initial_slope": slope0,
+        "initial_season": season0,
+    }
+
+
+def forecast_batch(state, horizon):
+    return forecast_from_states(state["level"], state["slope"], state["season"], horizon, state["trend"], state["seasonal"])
+
+
+def simulate_paths(state, horizon, n_paths=2000, residuals=None, error="add", seed=None):
+    # Future sample paths (n_paths, horizon) of the model in ``state`` (smoothing_state). Every step
+    # forecasts one period for all paths at once, adds a sampled error and feeds the result through
+    # smooth_batch, so trend and season respond to the simulated values as they would to real ones.
+    # Errors are bootstrapped from ``residuals`` when given, normal with the state's sigma otherwise;
+    # error="mul" treats them as relative errors, which scale with the level of multiplicative models.
+    rng = np.random.default_rng(seed)
+    trend, seasonal = state["trend"], state["seasonal"]
+    if residuals is not None:
+        residuals = np.asarray(residuals, dtype=float)
+        residuals = residuals[np.isfinite(residuals)]
+        shocks = rng.choice(residuals, size=(horizon, n_paths))
+    else:
+        shocks = rng.normal(0.0, state["sigma"], size=(horizon, n_paths))
+    level = np.full(n_paths, state["level"], dtype=float)
+    slope = np.full(n_paths, state["slope"], dtype=float) if trend else None
+    season = np.tile(np.asarray(state["season"], dtype=float), (n_paths, 1)) if seasonal else None
+    paths = np.empty((horizon, n_paths))
+    with np.errstate(all="ignore"):
+        for t in range(horizon):
+            mean = forecast_from_states(level, slope, season, 1, trend, seasonal)[:, 0]
+            paths[t] = mean * (1 + shocks[t]) if error == "mul" else mean + shocks[t]
+            _, level, slope, season = smooth_batch(paths[t][:, None], state["alpha"], state["beta"], state["gamma"],
+                                                   level, slope, season, trend, seasonal)
+    return paths.T
+
+
+def path_quantiles(paths, quantiles):
+    # (len(quantiles), horizon); paths a multiplicative model drove to zero or below come out as nan and are skipped
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        return np.nanquantile(paths, quantiles, axis=0)
@@ -0,0 +1,106 @@
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+# What each stage of a cold start has to import, measured in a fresh interpreter
+TARGETS = {
+    "streamlit": "import streamlit",
+    "home page": "import streamlit, multiapp, apps.home",
+    "app start": "import runpy; runpy.run_path('main.py', run_name='__main__')",
+    "forecast page": "import streamlit, apps.forecast",
+    "first fit": "import apps.utils, statsmodels.tsa.statespace.sarimax, statsmodels.tsa.holtwinters",
+}
+
+_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def parse_importtime(stderr):
+    # (module, self_us, cumulative_us, depth) for every line of -X importtime output
+    rows = []
+    for line in stderr.splitlines():
+        match = _LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            rows.append((module, int(self_us), int(cumulative_us), len(indent) // 2))
+    return rows
+
+
+def measure_target(code, repeat=3):
+    # Fastest of ``repeat`` fresh interpreters: wall time and the modules imported at the top level
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        completed = subprocess.run([sys.executable, "-X", "importtime", "-W", "ignore", "-c", code], cwd=SRC_DIR,
+                                   capture_output=True, text=True)
+        wall = time.perf_counter() - start
+        if completed.returncode != 0:
+            raise RuntimeError(completed.stderr.strip().splitlines()[-1])
+        rows = parse_importtime(completed.stderr)
+        if best is None or wall < best["wall_ms"] / 1000:
+            top = sorted((row for row in rows if row[3] == 0), key=lambda row: -row[2])
+            best = {
+                "wall_ms": wall * 1000,
+                "import_ms": sum(row[2] for row in top) / 1000,
+                "modules": len(rows),
+                "heaviest": [{"module": module, "ms": cumulative / 1000} for module, _, cumulative, _ in top[:8]],
+            }
+    return best
+
+
+def interpreter_ms(repeat=3):
+    # Bare interpreter start, subtracted from wall times
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", "pass"], check=True)
+        times.append(time.perf_counter() - start)
+    return min(times) * 1000
+
+
+def report(targets, repeat=3):
+    baseline = interpreter_ms(repeat)
+    results = {}
+    for name in targets:
+        result = measure_target(TARGETS[name], repeat)
+        result["wall_ms"] -= baseline
+        results[name] = result
+    return {"interpreter_ms": baseline, "targets": results}
+
+
+def _print_report(results, before=None):
+    for name, result in results["targets"].items():
+        line = f"{name:<16} {result['wall_ms']:>8.0f} ms wall  {result['import_ms']:>8.0f} ms imports  {result['modules']:>5} modules"
+        if before and name in before["targets"]:
+            old = before["targets"][name]
+            line += f"   (before {old['wall_ms']:.0f} ms, {old['modules']} modules, {result['wall_ms'] - old['wall_ms']:+.0f} ms)"
+        print(line)
+        print("    " + ", ".join(f"{item['module']} {item['ms']:.0f}" for item in result["heaviest"]))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure cold-start import cost of the app in fresh interpreters.")
+    parser.add_argument("--targets", nargs="+", default=list(TARGETS), choices=list(TARGETS))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="Write the report as JSON")
+    parser.add_argument("--before", help="JSON report of an earlier run to compare against")
+    args = parser.parse_args(argv)
+
+    results = report(args.targets, args.repeat)
+    before = None
+    if args.before:
+        with open(args.before) as f:
+            before = json.load(f)
+    _print_report(results, before)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+import argparse
+import pickle
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from apps.holt_winters import fixed_params, refilter, smoothing_state, update_state, forecast_state
+from apps.utils import parse_columns, resample_data, fit_sarimax, filter_sarimax, fit_holt_winters
+
+
+def append_observations(df, new_rows, date_col, target_col, date_format, frequency, last_seen=None):
+    # Folds raw rows into the resampled frame and returns (frame, added, revised, last_seen). last_seen is the
+    # latest raw timestamp already absorbed: rows at or before it are dropped, so the same rows sent twice count
+    # once, while later rows landing in the last bucket (the rest of a partial month) are summed into it.
+    # Without last_seen, rows falling in any stored bucket are dropped. Rows before the first stored bucket are
+    # backfilled history.
+    new = parse_columns(new_rows[[date_col, target_col]].copy(), date_col, target_col, date_format)
+    if new.empty:
+        return df, 0, 0, last_seen
+    series = df[target_col]
+    grouper = pd.Grouper(key=date_col, freq=frequency)
+    if last_seen is None:
+        older = new.groupby(grouper)[target_col].sum()
+        part = older[older.index > series.index[-1]] if len(series) else older
+    else:
+        older = new[new[date_col] <= last_seen].groupby(grouper)[target_col].sum()
+        part = new[new[date_col] > last_seen].groupby(grouper)[target_col].sum()
+    backfill = older[older.index < series.index[0]] if len(series) else older.iloc[:0]
+    latest = new[date_col].max()
+    last_seen = latest if last_seen is None else max(last_seen, latest)
+    part = pd.concat([backfill, part])
+    if part.empty:
+        return df, 0, 0, last_seen
+
+    # Resampling the union also fills any gap between the old end and the new rows with zero buckets
+    merged = series.add(part, fill_value=0).resample(frequency).sum().to_frame(target_col).rename_axis(date_col)
+    merged[target_col] = merged[target_col].astype(np.result_type(series.dtype, part.dtype))
+    # Backfilled history moves every stored bucket, otherwise only the last one can have been topped up
+    revised = len(df) if len(backfill) else int(part.index.isin(series.index).sum())
+    return merged, len(merged) - len(df), revised, last_seen
+
+
+def init_models(series, order, seasonal_order, trend, seasonal, seasonal_periods):
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        sarimax_fit = fit_sarimax(series, order, seasonal_order, disp=False)
+        hw_fit = fit_holt_winters(series, trend, seasonal, seasonal_periods)
+    return {
+        "series": series,
+        "order": order,
+        "seasonal_order": seasonal_order,
+        "seasonal_periods": seasonal_periods,
+        "sarimax": sarimax_fit,
+        "sarimax_params": sarimax_fit.params.to_dict(),
+        "holt_winters": smoothing_state(hw_fit),
+        "holt_winters_params": fixed_params(hw_fit),
+    }
+
+
+def _drifted(standardized_errors, alpha):
+    # Chi-square test on the standardized one-step errors of the new observations
+    from scipy.stats import chi2
+    errors = np.asarray(standardized_errors, dtype=float)
+    errors = errors[np.isfinite(errors)]
+    if len(errors) == 0:
+        return False
+    return chi2.sf(np.sum(errors ** 2), df=len(errors)) < alpha
+
+
+def update_models(models, series, revised=0, drift_alpha=0.01):
+    # Brings fitted models up to ``series`` in time proportional to the new observations.
+    # Parameters are only re-estimated (warm-started) when the new data fail a drift test.
+    models = dict(models)
+    old_n = len(models["series"])
+    new_values = series.iloc[old_n - revised:]
+    report = {"new": len(series) - old_n, "revised": revised, "sarimax_refit": False, "holt_winters_refit": False}
+    if len(new_values) == 0:
+        return models, report
+    order, seasonal_order = models["order"], models["seasonal_order"]
+    model_kwargs, _ = models["holt_winters_params"]
+
+    if old_n - revised <= 0 or series.index[0] != models["series"].index[0]:
+        # Every bucket revised or history backfilled: there is no unchanged prefix to filter from and
+        # the stored initial states belong to the old start, so both models are fitted afresh
+        refit = init_models(series, order, seasonal_order, model_kwargs["trend"], model_kwargs["seasonal"],
+                            models["seasonal_periods"])
+        report.update(sarimax_refit=True, holt_winters_refit=True)
+        return refit, report
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        if revised:
+            # A revised bucket invalidates the last filtered state, so re-filter with the same parameters
+            sarimax_fit = filter_sarimax(series, order, seasonal_order, models["sarimax_params"])
+            errors = sarimax_fit.filter_results.standardized_forecasts_error[0, -len(new_values):]
+        else:
+            sarimax_fit = models["sarimax"].extend(new_values)
+            errors = sarimax_fit.filter_results.standardized_forecasts_error[0]
+        if _drifted(errors, drift_alpha):
+            sarimax_fit = fit_sarimax(series, order, seasonal_order, start_params=models["sarimax_params"], disp=False)
+            models["sarimax_params"] = sarimax_fit.params.to_dict()
+            report["sarimax_refit"] = True
+        models["sarimax"] = sarimax_fit
+
+        if revised:
+            hw_state = smoothing_state(refilter(series.iloc[:old_n - revised], *models["holt_winters_params"]))
+        else:
+            hw_state = models["holt_winters"]
+        hw_state, errors = update_state(hw_state, new_values.to_numpy())
+        if _drifted(errors / models["holt_winters"]["sigma"], drift_alpha):
+            hw_fit = fit_holt_winters(series, model_kwargs["trend"], model_kwargs["seasonal"], models["seasonal_periods"])
+            hw_state = smoothing_state(hw_fit)
+            models["holt_winters_params"] = fixed_params(hw_fit)
+            report["holt_winters_refit"] = True
+        models["holt_winters"] = hw_state
+
+    models["series"] = series
+    return models, report
+
+
+def forecast_models(models, horizon):
+    series = models["series"]
+    index = pd.date_range(series.index[-1], periods=horizon + 1, freq=series.index.freq)[1:]
+    return pd.DataFrame({
+        "SARIMAX": np.asarray(models["sarimax"].forecast(steps=horizon)),
+        "Holt-Winters": forecast_state(models["holt_winters"], horizon),
+    }, index=index)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fit models once, then refresh forecasts as new rows arrive.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    init = subparsers.add_parser("init", help="Preprocess a CSV, fit both models and save the state")
+    update = subparsers.add_parser("update", help="Append new rows to a saved state and refresh the forecast")
+    for sub in (init, update):
+        sub.add_argument("csv")
+        sub.add_argument("state", help="Pickle file holding the series and fitted models")
+        sub.add_argument("--horizon", type=int, default=12)
+        sub.add_argument("--output", help="CSV file to write the forecast to")
+    init.add_argument("--date-col", required=True)
+    init.add_argument("--target-col", required=True)
+    init.add_argument("--date-format", default="%Y-%m-%d")
+    init.add_argument("--frequency", default="M", choices=["D", "W", "M", "Q", "Y"])
+    init.add_argument("--order", type=int, nargs=3, default=[1, 1, 1])
+    init.add_argument("--seasonal-order", type=int, nargs=4, default=[1, 1, 1, 12])
+    init.add_argument("--trend", default="mul", choices=["add", "mul", "none"])
+    init.add_argument("--seasonal", default="mul", choices=["add", "mul", "none"])
+    init.add_argument("--seasonal-periods", type=int, default=12)
+    update.add_argument("--drift-alpha", type=float, default=0.01)
+    args = parser.parse_args(argv)
+
+    if args.command == "init":
+        config = {"date_col": args.date_col, "target_col": args.target_col, "date_format": args.date_format, "frequency": args.frequency}
+        rows = parse_columns(pd.read_csv(args.csv), args.date_col, args.target_col, args.date_format)
+        df = resample_data(rows, args.date_col, args.target_col, args.frequency)
+        models = init_models(
+            df[args.target_col], tuple(args.order), tuple(args.seasonal_order),
+            None if args.trend == "none" else args.trend, None if args.seasonal == "none" else args.seasonal,
+            args.seasonal_periods,
+        )
+        # Later updates skip rows at or before the last raw timestamp absorbed
+        models["last_seen"] = rows[args.date_col].max()
+        print(f"Fitted on {len(df)} observations")
+    else:
+        with open(args.state, "rb") as f:
+            config, df, models = pickle.load(f)
+        df, added, revised, last_seen = append_observations(df, pd.read_csv(args.csv), **config, last_seen=models.get("last_seen"))
+        models, report = update_models(models, df[config["target_col"]], revised, args.drift_alpha)
+        models["last_seen"] = last_seen
+        print(f"{report['new']} new and {report['revised']} revised observations, "
+              f"SARIMAX {'refit' if report['sarimax_refit'] else 'updated'}, "
+              f"Holt-Winters {'refit' if report['holt_winters_refit'] else 'updated'}")
+
+    with open(args.state, "wb") as f:
+        pickle.dump((config, df, models), f, protocol=pickle.HIGHEST_PROTOCOL)
+    forecast = forecast_models(models, args.horizon)
+    if args.output:
+        forecast.to_csv(args.output, index_label=config["date_col"])
+    else:
+        print(forecast)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+import itertools
+import math
+import time
+import warnings
+
+import pandas as pd
+from numpy.linalg import LinAlgError
+
+from apps.utils import fit_sarimax, WorkerPool
+
+
+def score_order(train, order, seasonal_order, criterion="aic", holdout=0.2, start_params=None):
+    from sklearn.metrics import mean_absolute_error
+    start = time.perf_counter()
+    fit_data, valid = train, None
+    if criterion != "aic":
+        split = int(len(train) * (1 - holdout))
+        fit_data, valid = train.iloc[:split], train.iloc[split:]
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        try:
+            try:
+                model_fit = fit_sarimax(fit_data, order, seasonal_order, start_params=start_params, disp=False)
+            except (ValueError, LinAlgError):
+                if start_params is None:
+                    raise
+                # Borrowed parameters can make the start non-stationary, fall back to the default start
+                model_fit = fit_sarimax(fit_data, order, seasonal_order, disp=False)
+        except Exception as e:
+            return {"order": order, "seasonal_order": seasonal_order, "aic": math.inf, "mae": math.inf,
+                    "score": math.inf, "params": None, "seconds": time.perf_counter() - start, "error": str(e)}
+    mae = mean_absolute_error(valid, model_fit.forecast(steps=len(valid))) if valid is not None else math.nan
+    return {
+        "order": order,
+        "seasonal_order": seasonal_order,
+        "aic": model_fit.aic,
+        "mae": mae,
+        "score": model_fit.aic if criterion == "aic" else mae,
+        "params": model_fit.params.to_dict(),
+        "seconds": time.perf_counter() - start,
+        "error": None,
+    }
+
+
+def _neighbours(order, seasonal_order, max_order, max_seasonal_order):
+    # Stepwise moves: +-1 on each of p, q, P, Q and on p and q (or P and Q) together
+    p, d, q = order
+    sp, sd, sq, s = seasonal_order
+    moves = [(1, 0, 0, 0), (-1, 0, 0, 0), (0, 1, 0, 0), (0, -1, 0, 0), (1, 1, 0, 0), (-1, -1, 0, 0)]
+    if s > 1:
+        moves += [(0, 0, 1, 0), (0, 0, -1, 0), (0, 0, 0, 1), (0, 0, 0, -1), (0, 0, 1, 1), (0, 0, -1, -1)]
+    for dp, dq, dsp, dsq in moves:
+        candidate = (p + dp, q + dq, sp + dsp, sq + dsq)
+        if min(candidate) < 0:
+            continue
+        if max(candidate[:2]) > max_order or max(candidate[2:]) > max_seasonal_order:
+            continue
+        yield (candidate[0], d, candidate[1]), (candidate[2], sd, candidate[3], s)
+
+
+def _initial_candidates(d, sd, s, max_order, max_seasonal_order):
+    seasonal = s > 1
+    candidates = [(2, 2, 1, 1), (0, 0, 0, 0), (1, 0, 1, 0), (0, 1, 0, 1)]
+    for p, q, sp, sq in candidates:
+        if not seasonal:
+            sp = sq = 0
+        yield (min(p, max_order), d, min(q, max_order)), (min(sp, max_seasonal_order), sd if seasonal else 0, min(sq, max_seasonal_order), s if seasonal else 0)
+
+
+def _grid_candidates(d, sd, s, max_order, max_seasonal_order):
+    seasonal = s > 1
+    seasonal_range = range(max_seasonal_order + 1) if seasonal else [0]
+    grid = itertools.product(range(max_order + 1), range(max_order + 1), seasonal_range, seasonal_range)
+    # Simplest models first so an early stop still covers the most plausible orders
+    for p, q, sp, sq in sorted(grid, key=sum):
+        yield (p, d, q), (sp, sd if seasonal else 0, sq, s if seasonal else 0)
+
+
+def _closest_params(results, order, seasonal_order):
+    best = None
+    for result in results.values():
+        if result["params"] is None:
+            continue
+        distance = sum(abs(a - b) for a, b in zip(order + seasonal_order, result["order"] + result["seasonal_order"]))
+        if best is None or (distance, result["score"]) < best[0]:
+            best = ((distance, result["score"]), result["params"])
+    return best[1] if best else None
+
+
+def search_orders(train, d=1, seasonal_d=1, s=12, criterion="aic", holdout=0.2, max_order=3,
+                  max_seasonal_order=2, stepwise=True, max_models=64, time_budget=None, pool=None,
+                  on_progress=None):
+    # Differencing orders stay fixed since AIC is not comparable across them. Candidates are
+    # fitted in parallel on the pool, each warm-started from the closest model fitted so far.
+    own_pool = pool is None
+    pool = pool or WorkerPool()
+    start = time.monotonic()
+    results = {}
+    best_key = None
+
+    if stepwise:
+        batch = list(_initial_candidates(d, seasonal_d, s, max_order, max_seasonal_order))
+    else:
+        grid = _grid_candidates(d, seasonal_d, s, max_order, max_seasonal_order)
+        batch = list(itertools.islice(grid, pool.processes))
+
+    try:
+        while batch:
+            batch = [key for key in dict.fromkeys(batch) if key not in results][:max_models - len(results)]
+            if not batch:
+                break
+            remaining = None
+            if time_budget is not None:
+                remaining = time_budget - (time.monotonic() - start)
+                if remaining <= 0:
+                    break
+            jobs = {
+                key: (score_order, (train, key[0], key[1], criterion, holdout, _closest_params(results, *key)))
+                for key in batch
+            }
+            for key, job in pool.run(jobs, timeout=remaining).items():
+                if job.error is None:
+                    results[key] = job.value
+            if on_progress is not None:
+                on_progress(len(results), max_models, time.monotonic() - start)
+
+            previous_best = best_key
+            scored = [key for key in results if math.isfinite(results[key]["score"])]
+            if scored:
+                best_key = min(scored, key=lambda key: results[key]["score"])
+            if len(results) >= max_models:
+                break
+            if stepwise:
+                # Stop once a round of neighbours fails to improve on the current best
+                if best_key is None or (previous_best is not None and best_key == previous_best):
+                    break
+                batch = list(_neighbours(*best_key, max_order, max_seasonal_order))
+            else:
+                batch = list(itertools.islice(grid, pool.processes))
+    finally:
+        if own_pool:
+            pool.terminate()
+
+    leaderboard = pd.DataFrame(list(results.values()), columns=[
+        "order", "seasonal_order", "aic", "mae", "score", "seconds", "error",
+    ])
+    return leaderboard.sort_values("score", kind="stable").reset_index(drop=True)
@@ -0,0 +1,204 @@
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+import pandas as pd
+
+# The profiler of the current Streamlit run (or worker job); None means tracing is off and
+# traced functions cost one context variable lookup
+_active = contextvars.ContextVar("profiler", default=None)
+
+# tracemalloc is one process-wide tracer with a single peak, so only one profiler at a time tracks memory.
+# The reference count keeps it running for as long as anyone uses it and never stops a tracer started elsewhere
+_memory_lock = threading.Lock()
+_memory_owner = None
+_tracemalloc_refs = 0
+_tracemalloc_started = False
+
+
+def _claim_memory(profiler):
+    global _memory_owner, _tracemalloc_refs, _tracemalloc_started
+    with _memory_lock:
+        if _memory_owner is not None:
+            return False
+        _memory_owner = profiler
+        if _tracemalloc_refs == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _tracemalloc_started = True
+        _tracemalloc_refs += 1
+        return True
+
+
+def _release_memory(profiler):
+    global _memory_owner, _tracemalloc_refs, _tracemalloc_started
+    with _memory_lock:
+        if _memory_owner is not profiler:
+            return
+        _memory_owner = None
+        _tracemalloc_refs -= 1
+        if _tracemalloc_refs == 0 and _tracemalloc_started:
+            tracemalloc.stop()
+            _tracemalloc_started = False
+
+
+def optimizer_stats(result):
+    # Iteration counts of a fitted statsmodels result: MLE results keep a dict, Holt-Winters a scipy OptimizeResult
+    retvals = getattr(result, "mle_retvals", None)
+    if retvals is None:
+        return {}
+    if isinstance(retvals, dict) and "iterations" in retvals:
+        return {"iterations": int(retvals["iterations"]), "fcalls": int(retvals.get("fcalls", 0)),
+                "converged": bool(retvals.get("converged", True))}
+    if hasattr(retvals, "nit"):
+        return {"iterations": int(retvals.nit), "fcalls": int(getattr(retvals, "nfev", 0)),
+                "converged": bool(getattr(retvals, "success", True))}
+    return {}
+
+
+class Profiler:
+    # memory_busy is set when memory tracking was asked for while another profiler of this process had it;
+    # such a profiler records timings only
+    def __init__(self, memory=False):
+        self.memory = memory
+        self.memory_busy = False
+        self.spans = []
+        self._stack = []
+
+    def __enter__(self):
+        if self.memory and not _claim_memory(self):
+            self.memory = False
+            self.memory_busy = True
+        self._token = _active.set(self)
+        return self
+
+    def __exit__(self, *exc):
+        _active.reset(self._token)
+        if self.memory:
+            _release_memory(self)
+        return False
+
+    @contextmanager
+    def span(self, name, **args):
+        entry = {"name": name, "args": args, "peak": 0}
+        if self.memory:
+            # tracemalloc has a single peak, so each span resets it and hands its own peak up to the parent
+            current, peak = tracemalloc.get_traced_memory()
+            if self._stack:
+                self._stack[-1]["peak"] = max(self._stack[-1]["peak"], peak - self._stack[-1]["base"])
+            tracemalloc.reset_peak()
+            entry["base"] = current
+        self._stack.append(entry)
+        start = time.perf_counter_ns()
+        try:
+            yield entry["args"]
+        finally:
+            end = time.perf_counter_ns()
+            self._stack.pop()
+            if self.memory:
+                _, peak = tracemalloc.get_traced_memory()
+                entry["peak"] = max(entry["peak"], peak - entry["base"])
+                tracemalloc.reset_peak()
+                if self._stack:
+                    parent = self._stack[-1]
+                    parent["peak"] = max(parent["peak"], entry["peak"] + entry["base"] - parent["base"])
+                entry["args"]["peak_mb"] = round(entry["peak"] / 2 ** 20, 3)
+            self.record(name, start, end, entry["args"], depth=len(self._stack))
+
+    def record(self, name, start_ns, end_ns, args=None, pid=None, tid=None, depth=0):
+        self.spans.append({
+            "name": name,
+            "start_ns": start_ns,
+            "end_ns": end_ns,
+            "pid": pid or os.getpid(),
+            "tid": tid or threading.get_ident(),
+            "depth": depth,
+            "args": args or {},
+        })
+
+    def extend(self, spans):
+        # Spans recorded in a worker process, nested under the current span. perf_counter is the
+        # system-wide monotonic clock on Linux, so their timestamps line up with ours
+        depth = len(self._stack)
+        for span in spans:
+            self.spans.append({**span, "depth": span["depth"] + depth})
+
+    def to_frame(self):
+        if not self.spans:
+            return pd.DataFrame(columns=["Span", "Start (ms)", "Duration (ms)", "Process", "Details"])
+        origin = min(span["start_ns"] for span in self.spans)
+        rows = sorted(self.spans, key=lambda span: (span["start_ns"], span["depth"]))
+        return pd.DataFrame({
+            "Span": ["  " * span["depth"] + span["name"] for span in rows],
+            "Start (ms)": [(span["start_ns"] - origin) / 1e6 for span in rows],
+            "Duration (ms)": [(span["end_ns"] - span["start_ns"]) / 1e6 for span in rows],
+            "Process": [span["pid"] for span in rows],
+            "Details": [", ".join(f"{key}={value}" for key, value in span["args"].items()) for span in rows],
+        })
+
+    def chrome_trace(self):
+        # Trace Event Format, opens in chrome://tracing and Perfetto
+        events = [{
+            "name": span["name"],
+            "ph": "X",
+            "ts": span["start_ns"] / 1000,
+            "dur": (span["end_ns"] - span["start_ns"]) / 1000,
+            "pid": span["pid"],
+            "tid": span["tid"],
+            "args": span["args"],
+        } for span in self.spans]
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def write_chrome_trace(self, path):
+        with open(path, "w") as f:
+            json.dump(self.chrome_trace(), f, default=str)
+        return path
+
+
+def active_profiler():
+    return _active.get()
+
+
+@contextmanager
+def span(name, **args):
+    profiler = _active.get()
+    if profiler is None:
+        yield args
+        return
+    with profiler.span(name, **args) as span_args:
+        yield span_args
+
+
+def traced(name=None, result_args=None):
+    # Records a span per call while a Profiler is active; result_args(result) adds details such as iteration counts
+    def decorator(func):
+        span_name = name or f"{func.__module__}.{func.__name__}"
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            profiler = _active.get()
+            if profiler is None:
+                return func(*args, **kwargs)
+            with profiler.span(span_name) as span_args:
+                result = func(*args, **kwargs)
+                if result_args is not None:
+                    span_args.update(result_args(result))
+                return result
+        return wrapper
+    return decorator
+
+
+def profiled_call(func, args, kwargs, memory=False):
+    # Runs ``func`` in a worker under its own profiler and returns the spans alongside the value
+    with Profiler(memory=memory) as profiler:
+        if hasattr(func, "__wrapped__"):
+            # Already traced
+            value = func(*args, **kwargs)
+        else:
+            with profiler.span(f"{func.__module__}.{func.__name__}"):
+                value = func(*args, **kwargs)
+    return value, profiler.spans
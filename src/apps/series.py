@@ -0,0 +1,125 @@
+import numpy as np
+import pandas as pd
+from pandas.tseries.frequencies import to_offset
+
+
+def downcast(values):
+    # float32 only where it is lossless, e.g. counts below 2**24; anything else stays float64
+    values = np.asarray(values)
+    if values.dtype == np.float32:
+        return values
+    if values.dtype.kind not in "iuf":
+        return values.astype(np.float64)
+    narrow = values.astype(np.float32)
+    if np.array_equal(narrow.astype(values.dtype), values, equal_nan=values.dtype.kind == "f"):
+        return narrow
+    return values.astype(np.float64, copy=False)
+
+
+class _PositionIndexer:
+    def __init__(self, series):
+        self._series = series
+
+    def __getitem__(self, key):
+        if isinstance(key, slice) and key.step in (None, 1):
+            return self._series._slice(key.start, key.stop)
+        if isinstance(key, (int, np.integer)):
+            return self._series.values[key]
+        return self._series.take(key)
+
+
+class _DateIndexer:
+    def __init__(self, series):
+        self._series = series
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            raise TypeError("CompactSeries.loc only supports date slices")
+        positions = self._series.index.slice_indexer(key.start, key.stop)
+        return self._series._slice(positions.start, positions.stop)
+
+
+class CompactSeries:
+    # A regularly spaced series kept as one values array plus start, freq and length. The DatetimeIndex
+    # is derived when asked for instead of stored, and positional or date slices are views of the values.
+    # iloc, loc, index and to_numpy follow pandas, so most code that takes a Series takes this too
+    def __init__(self, values, start, freq, name=None, index_name=None):
+        self.values = values
+        self.start = None if start is None else pd.Timestamp(start)
+        self.freq = to_offset(freq)
+        self.name = name
+        self.index_name = index_name
+
+    @classmethod
+    def from_series(cls, series, dtype="auto"):
+        index = series.index
+        freq = index.freq or (pd.infer_freq(index) if len(index) >= 3 else None)
+        if freq is None:
+            raise ValueError("CompactSeries needs a DatetimeIndex with a regular frequency")
+        values = series.to_numpy()
+        values = downcast(values) if dtype == "auto" else values.astype(dtype, copy=False)
+        return cls(values, index[0] if len(index) else None, freq, series.name, index.name)
+
+    def __len__(self):
+        return len(self.values)
+
+    def __array__(self, dtype=None, copy=None):
+        return np.asarray(self.values, dtype=dtype)
+
+    def __repr__(self):
+        return f"CompactSeries(name={self.name!r}, start={self.start}, freq={self.freqstr}, length={len(self)}, dtype={self.dtype})"
+
+    @property
+    def dtype(self):
+        return self.values.dtype
+
+    @property
+    def nbytes(self):
+        return self.values.nbytes
+
+    @property
+    def freqstr(self):
+        return self.freq.freqstr
+
+    @property
+    def end(self):
+        return None if self.start is None or not len(self) else self.start + (len(self) - 1) * self.freq
+
+    @property
+    def index(self):
+        if self.start is None or not len(self):
+            return pd.DatetimeIndex([], freq=self.freq, name=self.index_name)
+        return pd.date_range(self.start, periods=len(self), freq=self.freq, name=self.index_name)
+
+    @property
+    def iloc(self):
+        return _PositionIndexer(self)
+
+    @property
+    def loc(self):
+        return _DateIndexer(self)
+
+    def _slice(self, start, stop):
+        start, stop, _ = slice(start, stop).indices(len(self))
+        stop = max(start, stop)
+        first = None if self.start is None else self.start + start * self.freq
+        return CompactSeries(self.values[start:stop], first, self.freq, self.name, self.index_name)
+
+    def take(self, positions):
+        # Arbitrary positions are a copy anyway, so they come back as a regular Series
+        positions = np.asarray(positions)
+        return pd.Series(self.values[positions], index=self.index[positions], name=self.name)
+
+    def to_numpy(self, dtype=None):
+        return self.values if dtype is None else self.values.astype(dtype, copy=False)
+
+    def to_series(self):
+        return pd.Series(self.values, index=self.index, name=self.name, copy=False)
+
+    def to_frame(self, name=None):
+        return self.to_series().to_frame(name or self.name)
+
+
+def as_series(series):
+    # pandas Series for code that needs one (statsmodels, plotly), without copying the values
+    return series.to_series() if isinstance(series, CompactSeries) else series
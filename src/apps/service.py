@@ -0,0 +1,324 @@
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import tornado.web
+from tornado.httpclient import AsyncHTTPClient
+
+from apps.cache import fit_key
+from apps.incremental import init_models, update_models, forecast_models, append_observations
+from apps.utils import resample_data
+
+
+def series_from_payload(payload):
+    df = pd.DataFrame({"date": pd.to_datetime(payload["dates"]), "value": pd.to_numeric(payload["values"])})
+    return resample_data(df, "date", "value", payload.get("frequency", "M"))["value"]
+
+
+class Metrics:
+    def __init__(self, window=10000):
+        self.started = time.monotonic()
+        self.counts = defaultdict(int)
+        self.errors = defaultdict(int)
+        self.latencies = defaultdict(lambda: deque(maxlen=window))
+        self.batch_sizes = deque(maxlen=window)
+
+    def record(self, endpoint, seconds, ok=True):
+        self.counts[endpoint] += 1
+        if not ok:
+            self.errors[endpoint] += 1
+        self.latencies[endpoint].append(seconds)
+
+    def snapshot(self):
+        uptime = time.monotonic() - self.started
+        endpoints = {}
+        for endpoint, count in self.counts.items():
+            latencies = np.array(self.latencies[endpoint]) * 1000
+            endpoints[endpoint] = {
+                "requests": count,
+                "errors": self.errors[endpoint],
+                "requests_per_second": count / uptime,
+                "latency_ms": {f"p{q}": float(np.percentile(latencies, q)) for q in (50, 95, 99)},
+            }
+        return {
+            "uptime_seconds": uptime,
+            "endpoints": endpoints,
+            "mean_forecast_batch_size": float(np.mean(self.batch_sizes)) if self.batch_sizes else None,
+        }
+
+
+class ModelRegistry:
+    # Fitted models stay in memory; forecast requests for the same model that arrive within
+    # ``batch_window`` seconds share a single forecast call for the longest requested horizon,
+    # batch_window=None forecasts every request separately
+    def __init__(self, fit_executor, forecast_executor, metrics, batch_window=0.002):
+        self.fit_executor = fit_executor
+        self.forecast_executor = forecast_executor
+        self.metrics = metrics
+        self.batch_window = batch_window
+        self.models = {}
+        self.configs = {}
+        self._fitting = {}
+        self._pending = defaultdict(list)
+        # Updates to one model run one at a time, each folding its rows into the state the previous one stored
+        self._updating = defaultdict(asyncio.Lock)
+
+    async def register(self, payload):
+        series = series_from_payload(payload)
+        config = {
+            "order": tuple(payload.get("order", (1, 1, 1))),
+            "seasonal_order": tuple(payload.get("seasonal_order", (1, 1, 1, 12))),
+            "trend": payload.get("trend", "mul"),
+            "seasonal": payload.get("seasonal", "mul"),
+            "seasonal_periods": payload.get("seasonal_periods", 12),
+        }
+        model_id = fit_key("service", series, **config)[:16]
+        if model_id not in self.models:
+            # Concurrent registrations of the same series wait on one fit
+            if model_id not in self._fitting:
+                loop = asyncio.get_running_loop()
+                self._fitting[model_id] = loop.run_in_executor(
+                    self.fit_executor, init_models, series, config["order"], config["seasonal_order"],
+                    config["trend"], config["seasonal"], config["seasonal_periods"],
+                )
+            try:
+                # Later updates skip rows at or before the last raw timestamp absorbed
+                models = await self._fitting[model_id]
+                self.models[model_id] = {**models, "last_seen": pd.to_datetime(payload["dates"]).max()}
+                self.configs[model_id] = {**config, "frequency": payload.get("frequency", "M")}
+            finally:
+                self._fitting.pop(model_id, None)
+        return model_id
+
+    async def forecast(self, model_id, horizon):
+        models = self.models[model_id]
+        loop = asyncio.get_running_loop()
+        if self.batch_window is None:
+            return await loop.run_in_executor(self.forecast_executor, forecast_models, models, horizon)
+        future = loop.create_future()
+        pending = self._pending[model_id]
+        pending.append((horizon, future))
+        if len(pending) == 1:
+            loop.call_later(self.batch_window, lambda: asyncio.ensure_future(self._flush(model_id, models)))
+        return await future
+
+    async def _flush(self, model_id, models):
+        batch = self._pending.pop(model_id, [])
+        if not batch:
+            return
+        self.metrics.batch_sizes.append(len(batch))
+        horizon = max(h for h, _ in batch)
+        try:
+            forecast = await asyncio.get_running_loop().run_in_executor(self.forecast_executor, forecast_models, models, horizon)
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        for h, future in batch:
+            future.set_result(forecast.iloc[:h])
+
+    async def update(self, model_id, payload):
+        config = self.configs[model_id]
+        rows = pd.DataFrame({"date": payload["dates"], "value": payload["values"]})
+        async with self._updating[model_id]:
+            models = self.models[model_id]
+            df = models["series"].to_frame("value").rename_axis("date")
+            df, added, revised, last_seen = append_observations(df, rows, "date", "value", None, config["frequency"],
+                                                                models.get("last_seen"))
+            models, report = await asyncio.get_running_loop().run_in_executor(
+                self.fit_executor, update_models, models, df["value"], revised,
+            )
+            self.models[model_id] = {**models, "last_seen": last_seen}
+        return report
+
+
+class BaseHandler(tornado.web.RequestHandler):
+    def initialize(self, registry, metrics):
+        self.registry = registry
+        self.metrics = metrics
+        self.started = time.perf_counter()
+
+    def on_finish(self):
+        endpoint = f"{self.request.method} {self.endpoint}"
+        self.metrics.record(endpoint, time.perf_counter() - self.started, self.get_status() < 400)
+
+    def payload(self):
+        try:
+            return json.loads(self.request.body or b"{}")
+        except json.JSONDecodeError:
+            raise tornado.web.HTTPError(400, reason="Body must be JSON")
+
+    def write_error(self, status_code, **kwargs):
+        self.finish({"error": self._reason})
+
+
+class ModelsHandler(BaseHandler):
+    endpoint = "/models"
+
+    def get(self):
+        self.write({"models": {model_id: {**config, "nobs": len(self.registry.models[model_id]["series"])}
+                               for model_id, config in self.registry.configs.items()}})
+
+    async def post(self):
+        try:
+            model_id = await self.registry.register(self.payload())
+        except (KeyError, ValueError, TypeError) as e:
+            raise tornado.web.HTTPError(400, reason=str(e))
+        self.write({"model_id": model_id})
+
+
+class ForecastHandler(BaseHandler):
+    endpoint = "/models/{id}/forecast"
+
+    async def post(self, model_id):
+        if model_id not in self.registry.models:
+            raise tornado.web.HTTPError(404, reason=f"Unknown model {model_id}")
+        try:
+            horizon = int(self.payload().get("horizon", 12))
+        except (ValueError, TypeError):
+            raise tornado.web.HTTPError(400, reason="horizon must be an integer")
+        if horizon < 1:
+            raise tornado.web.HTTPError(400, reason="horizon must be positive")
+        forecast = await self.registry.forecast(model_id, horizon)
+        self.write({
+            "dates": forecast.index.strftime("%Y-%m-%d").tolist(),
+            **{column: forecast[column].tolist() for column in forecast.columns},
+        })
+
+
+class ObservationsHandler(BaseHandler):
+    endpoint = "/models/{id}/observations"
+
+    async def post(self, model_id):
+        if model_id not in self.registry.models:
+            raise tornado.web.HTTPError(404, reason=f"Unknown model {model_id}")
+        try:
+            report = await self.registry.update(model_id, self.payload())
+        except (KeyError, ValueError, TypeError) as e:
+            raise tornado.web.HTTPError(400, reason=str(e))
+        self.write({key: int(value) for key, value in report.items()})
+
+
+class MetricsHandler(BaseHandler):
+    endpoint = "/metrics"
+
+    def get(self):
+        self.write(self.metrics.snapshot())
+
+
+def make_app(processes=None, batch_window=0.002):
+    metrics = Metrics()
+    fit_executor = ProcessPoolExecutor(processes or os.cpu_count(), mp_context=multiprocessing.get_context("spawn"))
+    registry = ModelRegistry(fit_executor, ThreadPoolExecutor(4), metrics, batch_window)
+    kwargs = {"registry": registry, "metrics": metrics}
+    return tornado.web.Application([
+        (r"/models", ModelsHandler, kwargs),
+        (r"/models/([0-9a-f]+)/forecast", ForecastHandler, kwargs),
+        (r"/models/([0-9a-f]+)/observations", ObservationsHandler, kwargs),
+        (r"/metrics", MetricsHandler, kwargs),
+    ]), registry
+
+
+async def serve(host, port, processes, batch_window):
+    app, _ = make_app(processes, batch_window)
+    app.listen(port, address=host)
+    print(f"Serving forecasts on http://{host}:{port}")
+    await asyncio.Event().wait()
+
+
+async def check_concurrent_updates(client, base, registry, model_id):
+    # Two appends for consecutive periods sent at once must both land, whichever runs first
+    series = registry.models[model_id]["series"]
+    dates = pd.date_range(series.index[-1], periods=3, freq=series.index.freq)[1:]
+    responses = await asyncio.gather(*(
+        client.fetch(f"{base}/models/{model_id}/observations", method="POST", raise_error=False,
+                     body=json.dumps({"dates": [date.strftime("%Y-%m-%d")], "values": [float(series.iloc[-12])]}))
+        for date in dates
+    ))
+    response = await client.fetch(f"{base}/models")
+    nobs = json.loads(response.body)["models"][model_id]["nobs"]
+    return all(response.code == 200 for response in responses) and nobs == len(series) + 2
+
+
+async def benchmark(payload, requests, concurrency, horizon, batch_window, port=8765, processes=None):
+    # Load test against a local server with an in-process stand-in client
+    app, registry = make_app(processes, batch_window)
+    server = app.listen(port, address="127.0.0.1")
+    client = AsyncHTTPClient(max_clients=concurrency)
+    base = f"http://127.0.0.1:{port}"
+    try:
+        response = await client.fetch(f"{base}/models", method="POST", body=json.dumps(payload))
+        model_id = json.loads(response.body)["model_id"]
+
+        latencies = []
+        queue = asyncio.Queue()
+        for _ in range(requests):
+            queue.put_nowait(None)
+
+        async def worker():
+            while not queue.empty():
+                queue.get_nowait()
+                start = time.perf_counter()
+                await client.fetch(f"{base}/models/{model_id}/forecast", method="POST", body=json.dumps({"horizon": horizon}))
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+        concurrent_updates_ok = await check_concurrent_updates(client, base, registry, model_id)
+    finally:
+        server.stop()
+        client.close()
+        registry.fit_executor.shutdown(cancel_futures=True)
+        registry.forecast_executor.shutdown()
+
+    latencies = np.array(latencies) * 1000
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "batch_window_ms": None if batch_window is None else batch_window * 1000,
+        "requests_per_second": requests / elapsed,
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+        "mean_batch_size": registry.metrics.snapshot()["mean_forecast_batch_size"],
+        "concurrent_updates_ok": concurrent_updates_ok,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve forecasts from warm SARIMAX and Holt-Winters models over HTTP.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--processes", type=int, default=None, help="Worker processes for model fits")
+    parser.add_argument("--batch-window-ms", type=float, default=2.0, help="Negative disables request batching")
+    parser.add_argument("--benchmark", action="store_true", help="Run a local load test instead of serving")
+    parser.add_argument("--benchmark-csv", default=os.path.join(os.path.dirname(__file__), "..", "..", "sample data sets",
+                                                                "Electricity Production - Electric_Production (1).csv"))
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--horizon", type=int, default=12)
+    args = parser.parse_args(argv)
+
+    if not args.benchmark:
+        batch_window = args.batch_window_ms / 1000 if args.batch_window_ms >= 0 else None
+        asyncio.run(serve(args.host, args.port, args.processes, batch_window))
+        return
+
+    raw = pd.read_csv(args.benchmark_csv)
+    payload = {"dates": raw.iloc[:, 0].tolist(), "values": raw.iloc[:, 1].tolist(), "frequency": "M"}
+    for batch_window in (None, max(args.batch_window_ms, 0) / 1000):
+        stats = asyncio.run(benchmark(payload, args.requests, args.concurrency, args.horizon, batch_window, args.port,
+                                     args.processes))
+        print(json.dumps(stats))
+
+
+if __name__ == "__main__":
+    main()
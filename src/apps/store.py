@@ -0,0 +1,84 @@
+import hashlib
+import json
+import os
+
+import pyarrow as pa
+
+from apps.cache import evict_oldest_files
+from apps.series import CompactSeries
+
+DEFAULT_DIRECTORY = os.path.join(os.path.expanduser("~"), ".cache", "time-series-forecasting", "series")
+
+
+def file_digest(uploaded_file, chunk_size=1 << 20):
+    h = hashlib.sha256()
+    uploaded_file.seek(0)
+    for chunk in iter(lambda: uploaded_file.read(chunk_size), b""):
+        h.update(chunk)
+    uploaded_file.seek(0)
+    return h.hexdigest()
+
+
+class SeriesStore:
+    # Content-addressed store of preprocessed CompactSeries as uncompressed Arrow IPC files, which
+    # are read back through a memory map instead of re-parsing and resampling the CSV
+    def __init__(self, directory=None, max_entries=128):
+        self.directory = directory or os.environ.get("SERIES_CACHE_DIR") or DEFAULT_DIRECTORY
+        self.max_entries = max_entries
+        os.makedirs(self.directory, exist_ok=True)
+
+    def key(self, file_hash, date_col, target_col, date_format, frequency):
+        return hashlib.sha256(repr((file_hash, date_col, target_col, date_format, frequency)).encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.arrow")
+
+    def get(self, key):
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            with pa.memory_map(path) as source:
+                table = pa.ipc.open_file(source).read_all()
+        except (OSError, pa.ArrowInvalid):
+            return None
+        metadata = table.schema.metadata or {}
+        if b"start" not in metadata:
+            # Written before series were stored compact
+            return None
+        # A single-chunk float column without nulls converts without a copy, so the values stay a
+        # read-only view of the memory map and sessions loading the same file share its pages
+        values = table.column("values").to_numpy()
+        start = metadata[b"start"].decode() or None
+        info = json.loads(metadata[b"names"])
+        os.utime(path)
+        return CompactSeries(values, start, metadata[b"freq"].decode(), info["name"], info["index_name"])
+
+    def put(self, key, series):
+        metadata = {
+            b"start": b"" if series.start is None else series.start.isoformat().encode(),
+            b"freq": series.freqstr.encode(),
+            b"names": json.dumps({"name": series.name, "index_name": series.index_name}).encode(),
+        }
+        table = pa.table({"values": series.values}).replace_schema_metadata(metadata)
+        path = self._path(key)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with pa.OSFile(tmp, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+        os.replace(tmp, path)
+        evict_oldest_files(self.directory, ".arrow", self.max_entries)
+
+    def get_or_load(self, uploaded_file, date_col, target_col, date_format, frequency, loader, cache=None):
+        key = self.key(file_digest(uploaded_file), date_col, target_col, date_format, frequency)
+        if cache is not None:
+            # Sessions submitting the same file at once wait on one parse
+            return cache.get_or_fit(f"series-{key}", self._get_or_load, key, uploaded_file, date_col, target_col,
+                                    date_format, frequency, loader)
+        return self._get_or_load(key, uploaded_file, date_col, target_col, date_format, frequency, loader)
+
+    def _get_or_load(self, key, uploaded_file, date_col, target_col, date_format, frequency, loader):
+        series = self.get(key)
+        if series is None:
+            series = loader(uploaded_file, date_col, target_col, date_format, frequency)
+            self.put(key, series)
+        return series
@@ -1,14 +1,58 @@
+import json
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+from collections import deque, namedtuple
+from statistics import NormalDist
+
+import numpy as np
 import pandas as pd
-from statsmodels.tsa.statespace.sarimax import SARIMAX
-from statsmodels.tsa.holtwinters import ExponentialSmoothing
-from sklearn.metrics import mean_absolute_error, mean_absolute_percentage_error, r2_score
+from apps.holt_winters import smoothing_state, forecast_batch, simulate_paths, path_quantiles
+from apps.profiling import traced, optimizer_stats, profiled_call, span
+from apps.series import CompactSeries, as_series
+
+# statsmodels and scikit-learn are imported inside the functions that use them: together they take
+# seconds to import, which every page load and every spawned worker would otherwise pay up front
 
+@traced()
 def load_data(uploaded_file):
     if uploaded_file:
         df = pd.read_csv(uploaded_file)
         return df
     return None
 
+@traced()
+def load_preview(uploaded_file, nrows=1000):
+    # Only the first chunk is parsed, enough to show the data and pick columns
+    uploaded_file.seek(0)
+    df = pd.read_csv(uploaded_file, nrows=nrows)
+    uploaded_file.seek(0)
+    return df
+
+@traced()
+def load_series_chunked(uploaded_file, date_col, target_col, date_format, frequency, chunksize=100_000):
+    # Same values as preprocess_data(load_data(...)) as a CompactSeries, but reads only the two columns and
+    # folds each chunk into per-bucket sums, so memory grows with the number of output buckets, not input rows
+    uploaded_file.seek(0)
+    totals = None
+    dtypes = []
+    for chunk in pd.read_csv(uploaded_file, usecols=[date_col, target_col], chunksize=chunksize):
+        chunk = parse_columns(chunk, date_col, target_col, date_format)
+        if chunk.empty:
+            continue
+        part = chunk.groupby(pd.Grouper(key=date_col, freq=frequency))[target_col].sum()
+        dtypes.append(part.dtype)
+        totals = part if totals is None else totals.add(part, fill_value=0)
+    uploaded_file.seek(0)
+
+    if totals is None:
+        totals = pd.Series([], index=pd.DatetimeIndex([], name=date_col), dtype=float, name=target_col)
+    else:
+        totals = totals.astype(np.result_type(*dtypes))
+    return CompactSeries.from_series(totals.sort_index().resample(frequency).sum())
+
 # def preprocess_data(df, date_col, target_col, date_format, frequency):
 #     df[date_col] = pd.to_datetime(df[date_col], format=date_format, errors='coerce')
 #     df[target_col] = pd.to_numeric(df[target_col], errors='coerce')
@@ -19,15 +63,24 @@ def load_data(uploaded_file):
 #     df[target_col] = df[target_col].fillna(df[target_col].rolling(window=3, min_periods=1).mean())
 #     return df
 
-def preprocess_data(df, date_col, target_col, date_format, frequency):
+@traced()
+def parse_columns(df, date_col, target_col, date_format):
     df[date_col] = pd.to_datetime(df[date_col], format=date_format, errors='coerce', yearfirst=True)
     df[target_col] = pd.to_numeric(df[target_col], errors='coerce')
-    df = df.dropna(subset=[date_col, target_col])
-    df = df[[date_col, target_col]].groupby(date_col).sum().reset_index()
-    df.set_index(date_col, inplace=True)
-    df = df.resample(frequency).sum()
-    df[target_col] = df[target_col].fillna(df[target_col].rolling(window=3, min_periods=1).mean())
-    return df
+    # Clean files skip the dropna copy
+    valid = df[date_col].notna() & df[target_col].notna()
+    return df if valid.all() else df[valid]
+
+@traced()
+def resample_data(df, date_col, target_col, frequency):
+    # One resample straight off the two columns; empty periods sum to 0, so nothing is left to fill
+    series = pd.Series(df[target_col].to_numpy(), index=pd.DatetimeIndex(df[date_col]), name=target_col)
+    return series.resample(frequency).sum().to_frame()
+
+@traced()
+def preprocess_data(df, date_col, target_col, date_format, frequency):
+    df = parse_columns(df, date_col, target_col, date_format)
+    return resample_data(df, date_col, target_col, frequency)
 
 def train_test_split(df, test_size):
     n = len(df)
@@ -35,26 +88,483 @@ def train_test_split(df, test_size):
     test_df = df.iloc[int(n*(1-test_size)):]
     return train_df, test_df
 
-def sarimax_forecast(train, test, order, seasonal_order):
-    model = SARIMAX(train, order=order, seasonal_order=seasonal_order)
-    model_fit = model.fit()
-    forecast = model_fit.forecast(steps=len(test))
-    return forecast
+class _BudgetExceeded(Exception):
+    def __init__(self, params, iterations):
+        self.params = params
+        self.iterations = iterations
+
+class FitCancelled(Exception):
+    pass
+
+# Cancel token of the pool job this worker process is running, see WorkerPool.submit
+_job_token = None
+
+def check_cancelled():
+    # Raises FitCancelled inside a pool job whose caller gave up on it; long fits call this from their loops
+    if _job_token is not None and not os.path.exists(_job_token):
+        raise FitCancelled("cancelled by the caller")
+
+def _write_progress(path, **progress):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(progress, f)
+    os.replace(tmp, path)
 
-def holt_winters_forecast(train, test, trend, seasonal, seasonal_periods):
-    model = ExponentialSmoothing(train, trend=trend, seasonal=seasonal, seasonal_periods=seasonal_periods)
-    model_fit = model.fit()
+def read_progress(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+@traced(result_args=optimizer_stats)
+def fit_sarimax(train, order, seasonal_order, start_params=None, time_budget=None, progress_path=None, **fit_kwargs):
+    # time_budget (seconds) stops the optimiser after the iteration that exceeds it and returns the filter
+    # results of the best parameters so far, flagged with budget_exceeded in mle_retvals. progress_path
+    # receives the iteration count and elapsed time when the fit starts and after every iteration. Inside a
+    # pool job, a cancelled job stops at its next likelihood evaluation
+    from statsmodels.tsa.statespace.sarimax import SARIMAX
+    model = SARIMAX(as_series(train), order=order, seasonal_order=seasonal_order)
+    if isinstance(start_params, dict):
+        # Warm start from a neighbouring fit: reuse parameters that share a name, default the rest
+        defaults = pd.Series(model.start_params, index=model.param_names)
+        shared = defaults.index.intersection(list(start_params))
+        defaults[shared] = [start_params[name] for name in shared]
+        start_params = defaults.values
+    if time_budget is None and progress_path is None and _job_token is None:
+        return model.fit(start_params=start_params, **fit_kwargs)
+
+    started = time.monotonic()
+    iterations = 0
+    if progress_path:
+        _write_progress(progress_path, iterations=0, elapsed=0.0)
+    if _job_token is not None:
+        # One optimiser iteration of a large seasonal model can take minutes, each of its likelihood
+        # evaluations (a gradient takes one per parameter) far less
+        loglike = model.loglike
+
+        def checked_loglike(*args, **kwargs):
+            check_cancelled()
+            return loglike(*args, **kwargs)
+        model.loglike = checked_loglike
+
+    def callback(unconstrained):
+        nonlocal iterations
+        iterations += 1
+        elapsed = time.monotonic() - started
+        if progress_path:
+            _write_progress(progress_path, iterations=iterations, elapsed=elapsed)
+        if time_budget is not None and elapsed > time_budget:
+            # The optimiser works on unconstrained parameters
+            raise _BudgetExceeded(model.transform_params(unconstrained), iterations)
+
+    try:
+        return model.fit(start_params=start_params, callback=callback, **fit_kwargs)
+    except _BudgetExceeded as e:
+        model_fit = model.filter(e.params)
+        model_fit._results.mle_retvals = {"iterations": e.iterations, "converged": False, "budget_exceeded": True}
+        return model_fit
+    finally:
+        # The results keep the model, which is pickled back to the caller without the closure
+        model.__dict__.pop("loglike", None)
+
+@traced(result_args=optimizer_stats)
+def filter_sarimax(train, order, seasonal_order, params):
+    # Results for already estimated parameters, one Kalman filter pass and no optimisation
+    from statsmodels.tsa.statespace.sarimax import SARIMAX
+    model = SARIMAX(as_series(train), order=order, seasonal_order=seasonal_order)
+    if isinstance(params, dict):
+        params = pd.Series(params)[model.param_names].to_numpy()
+    return model.filter(params)
+
+# Forecast quantiles the page draws as 50% and 90% bands and scores with the quantile loss
+QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+
+def normal_quantiles(mean, se, quantiles):
+    # One column per quantile of a normal forecast distribution
+    return pd.DataFrame({q: mean + NormalDist().inv_cdf(q) * se for q in quantiles}, index=mean.index)
+
+def _sarimax_output(model_fit, steps, quantiles):
+    # With quantiles, also returns their analytic bands from the state space forecast variance. How the
+    # parameters were estimated travels with the forecast in attrs["fit"]
+    retvals = getattr(model_fit, "mle_retvals", None) or {}
+    fit = {**optimizer_stats(model_fit), "budget_exceeded": bool(retvals.get("budget_exceeded", False))}
+    if quantiles is None:
+        forecast = model_fit.forecast(steps=steps)
+        forecast.attrs["fit"] = fit
+        return forecast
+    prediction = model_fit.get_forecast(steps=steps)
+    forecast = prediction.predicted_mean
+    forecast.attrs["fit"] = fit
+    return forecast, normal_quantiles(forecast, prediction.se_mean, quantiles)
+
+def sarimax_forecast(train, test, order, seasonal_order, quantiles=None, **fit_kwargs):
+    return _sarimax_output(fit_sarimax(train, order, seasonal_order, **fit_kwargs), len(test), quantiles)
+
+@traced()
+def quick_sarimax_forecast(train, test, order, seasonal_order, quantiles=None):
+    # A first answer for orders that take long to estimate: statsmodels' start parameters (Hannan-Rissanen
+    # and least squares estimates) through one Kalman filter pass, no likelihood optimisation
+    from statsmodels.tsa.statespace.sarimax import SARIMAX
+    model = SARIMAX(as_series(train), order=order, seasonal_order=seasonal_order)
+    with span("filter start_params"):
+        model_fit = model.filter(model.start_params)
+    return _sarimax_output(model_fit, len(test), quantiles)
+
+@traced(result_args=optimizer_stats)
+def fit_holt_winters(train, trend, seasonal, seasonal_periods, **fit_kwargs):
+    from statsmodels.tsa.holtwinters import ExponentialSmoothing
+    model = ExponentialSmoothing(as_series(train), trend=trend, seasonal=seasonal, seasonal_periods=seasonal_periods)
+    return model.fit(**fit_kwargs)
+
+def holt_winters_forecast(train, test, trend, seasonal, seasonal_periods, quantiles=None, n_paths=2000, seed=0):
+    # Holt-Winters has no closed-form intervals for multiplicative models, so with quantiles the bands
+    # come from simulated paths with bootstrapped in-sample errors (relative ones for multiplicative seasons)
+    model_fit = fit_holt_winters(train, trend, seasonal, seasonal_periods)
     forecast = model_fit.forecast(steps=len(test))
-    return model_fit, forecast
+    if quantiles is None:
+        return model_fit, forecast
+    # Long horizons get fewer paths so the path array stays around 16 MB
+    n_paths = max(200, min(n_paths, 2_000_000 // max(len(test), 1)))
+    error = "mul" if seasonal == "mul" else "add"
+    residuals = model_fit.resid / model_fit.fittedvalues if error == "mul" else model_fit.resid
+    state = smoothing_state(model_fit)
+    with span("simulate_paths", paths=n_paths, horizon=len(test)):
+        paths = simulate_paths(state, len(test), n_paths, residuals.to_numpy(), error, seed)
+    # statsmodels reuses a stale seasonal value at horizons m, 2m, ..., so the paths are moved onto its
+    # point forecast to keep the bands centred on the plotted line
+    centre = forecast_batch({**state, "level": [state["level"]], "slope": [state["slope"]], "season": [state["season"]]},
+                            len(test))[0]
+    with np.errstate(all="ignore"):
+        paths = paths * (forecast.to_numpy() / centre) if error == "mul" else paths + (forecast.to_numpy() - centre)
+    bands = pd.DataFrame(path_quantiles(paths, quantiles).T, index=forecast.index, columns=list(quantiles))
+    return model_fit, forecast, bands
+
+def quantile_loss(actual, bands):
+    # Pinball loss averaged over the quantile columns of ``bands``; lower is better, and at the median it is half the MAE
+    actual = np.asarray(actual, dtype=float)[:, None]
+    quantiles = np.asarray(bands.columns, dtype=float)
+    diff = actual - bands.to_numpy(dtype=float)
+    return float(np.nanmean(np.maximum(quantiles * diff, (quantiles - 1) * diff)))
 
-def calculate_kpis(test, sarimax_forecast, hw_forecast):
+@traced()
+def calculate_kpis(test, sarimax_forecast, hw_forecast, sarimax_bands=None, hw_bands=None):
+    from sklearn.metrics import mean_absolute_error, mean_absolute_percentage_error, r2_score
+    test = np.asarray(test)
     metrics = {
         "MAE": [mean_absolute_error(test, sarimax_forecast), mean_absolute_error(test, hw_forecast)],
         "MAPE": [mean_absolute_percentage_error(test, sarimax_forecast), mean_absolute_percentage_error(test, hw_forecast)],
         "R2": [r2_score(test, sarimax_forecast), r2_score(test, hw_forecast)]
     }
+    if sarimax_bands is not None and hw_bands is not None:
+        metrics["Quantile Loss"] = [quantile_loss(test, sarimax_bands), quantile_loss(test, hw_bands)]
     return pd.DataFrame(metrics, index=["SARIMAX", "Holt-Winters"])
 
 
+JobResult = namedtuple("JobResult", ["value", "error", "seconds", "spans"], defaults=(None,))
+
+class JobTimeout(Exception):
+    pass
+
+def _timed_call(func, args, kwargs, profile=None, token=None):
+    # profile is None, or the memory flag of the caller's profiler to trace the job with. The start time is
+    # written into the token, which fails if the caller removed it while the job was queued
+    global _job_token
+    if token is not None:
+        try:
+            with open(token, "r+") as f:
+                f.write(repr(time.time()))
+        except FileNotFoundError:
+            raise FitCancelled("cancelled before it started")
+        _job_token = token
+    start = time.perf_counter()
+    try:
+        if profile is None:
+            value, spans = func(*args, **kwargs), None
+        else:
+            value, spans = profiled_call(func, args, kwargs, memory=profile)
+    finally:
+        _job_token = None
+    return value, time.perf_counter() - start, spans
+
+class Job:
+    # A job submitted to a WorkerPool. Its token file exists while the job may run: the worker writes its
+    # start time there, and removing it cancels the job at its next check_cancelled(). ready() and get() work
+    # like an AsyncResult; get() gives (value, seconds, spans)
+    def __init__(self, pool, func, args, kwargs, profile=None):
+        fd, self.token = tempfile.mkstemp(prefix="forecast-job-", suffix=".token")
+        os.close(fd)
+        self.cancelled = False
+        self._on_late = None
+        self._delivered = False
+        self._lock = threading.Lock()
+        self.result = pool.apply_async(_timed_call, (func, args, kwargs, profile, self.token),
+                                       callback=self._finished, error_callback=self._failed)
+
+    def ready(self):
+        return self.result.ready()
+
+    def get(self, timeout=None):
+        return self.result.get(timeout)
+
+    def started(self):
+        # Wall-clock time a worker picked the job up, None while it is queued
+        try:
+            with open(self.token) as f:
+                return float(f.read())
+        except (OSError, ValueError):
+            return None
+
+    def elapsed(self):
+        started = self.started()
+        return None if started is None else time.time() - started
+
+    def cancel(self, on_late=None):
+        # on_late(value) receives the value if the job finishes anyway, e.g. between two cancellation checks
+        with self._lock:
+            self.cancelled = True
+            self._on_late = on_late
+        self._remove_token()
+        if self.result.ready() and self.result.successful():
+            self._finished(self.result.get())
+
+    def _remove_token(self):
+        try:
+            os.remove(self.token)
+        except FileNotFoundError:
+            pass
+
+    def _finished(self, result):
+        # Runs on the pool's result thread
+        self._remove_token()
+        with self._lock:
+            if not self.cancelled or self._on_late is None or self._delivered:
+                return
+            self._delivered = True
+        self._on_late(result[0])
+
+    def _failed(self, error):
+        self._remove_token()
+
+def _star_call(func_args):
+    func, args = func_args
+    return func(*args)
+
+class WorkerPool:
+    # nice > 0 lowers the workers' scheduling priority, for background work that should yield to interactive fits.
+    # A shared pool serves several callers at once, so timeouts and interruptions cancel the caller's jobs
+    # through their tokens instead of terminating workers that run other callers' jobs
+    def __init__(self, processes=None, nice=0, shared=False):
+        self.processes = processes or int(os.environ.get("WORKER_PROCESSES", 0)) or os.cpu_count()
+        self.nice = nice
+        self.shared = shared
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                # spawn avoids forking the multi-threaded Streamlit server
+                initializer, initargs = (os.nice, (self.nice,)) if self.nice else (None, ())
+                self._pool = multiprocessing.get_context("spawn").Pool(self.processes, initializer, initargs)
+            return self._pool
+
+    def submit(self, func, args=(), kwargs=None, profile=None):
+        # Starts one job and returns its Job at once; Job.cancel() stops it at its next cancellation check
+        return Job(self._get_pool(), func, args, kwargs or {}, profile)
+
+    def terminate(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.terminate()
+                self._pool = None
+
+    def _abandon(self, jobs, on_late=None):
+        # on_late(name, value) receives results of cancelled jobs that finish anyway
+        if not self.shared:
+            self.terminate()
+            for job in jobs.values():
+                job.cancel()
+            return
+        for name, job in jobs.items():
+            job.cancel(None if on_late is None else lambda value, name=name: on_late(name, value))
+
+    def imap_unordered(self, func, arg_tuples, chunksize=1):
+        # Streams results as they finish, for workloads too large to submit as one batch (private pools only)
+        pool = self._get_pool()
+        try:
+            yield from pool.imap_unordered(_star_call, ((func, args) for args in arg_tuples), chunksize)
+        except BaseException:
+            self.terminate()
+            raise
+
+    def run(self, jobs, timeout=None, on_wait=None, poll_interval=0.1, profile=None, on_late=None):
+        # jobs maps a name to (func, args) or (func, args, kwargs); independent jobs run concurrently.
+        # profile=True/False traces each job (with/without memory) and returns its spans in the JobResult.
+        # timeout counts from when a worker starts the job, so time queued behind other callers is free
+        start = time.monotonic()
+        pending = {}
+        for name, job in jobs.items():
+            func, args, kwargs = (tuple(job) + ({},))[:3]
+            pending[name] = self.submit(func, args, kwargs, profile)
+        results = {}
+        try:
+            while pending:
+                for name in [name for name, job in pending.items() if job.ready()]:
+                    try:
+                        value, seconds, spans = pending.pop(name).get()
+                        results[name] = JobResult(value, None, seconds, spans)
+                    except Exception as e:
+                        results[name] = JobResult(None, e, time.monotonic() - start)
+                if not pending:
+                    break
+                elapsed = time.monotonic() - start
+                overdue = {name: job for name, job in pending.items()
+                           if timeout is not None and (job.elapsed() or 0) > timeout}
+                if overdue:
+                    # On a private pool running fits cannot be interrupted individually, so drop the workers
+                    # and with them every pending job
+                    timed_out = overdue if self.shared else dict(pending)
+                    for name in timed_out:
+                        del pending[name]
+                        results[name] = JobResult(None, JobTimeout(f"{name} did not finish within {timeout}s"), elapsed)
+                    self._abandon(timed_out, on_late)
+                    continue
+                if on_wait is not None:
+                    on_wait(elapsed, list(pending))
+                time.sleep(poll_interval)
+        except BaseException:
+            # Streamlit raises on the script thread when inputs change mid-fit
+            if pending:
+                self._abandon(pending, on_late)
+            raise
+        return results
+
+
+def _run_in_process(conn, nice, func, args, kwargs):
+    if nice:
+        os.nice(nice)
+    try:
+        result = (True, _timed_call(func, args, kwargs))
+    except BaseException as e:
+        result = (False, e)
+    try:
+        conn.send(result)
+    except Exception as e:
+        # The value or the error did not pickle
+        conn.send((False, RuntimeError(f"result could not be sent: {e!r}")))
+    finally:
+        conn.close()
+
+class ProcessJob:
+    # A job submitted to a ProcessPool, with the same ready(), get(), elapsed() and cancel() as a Job.
+    # cancel() kills its process, so it stops at once however long the current step takes
+    def __init__(self, pool, func, args, kwargs, deadline):
+        self.pool = pool
+        self.call = (func, args, kwargs)
+        self.deadline = deadline
+        self.cancelled = False
+        self.process = None
+        self.conn = None
+        self.started_at = None
+        self.result = None
+
+    def ready(self):
+        self.pool._dispatch()
+        return self.result is not None
+
+    def get(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self.ready():
+            if deadline is not None and time.monotonic() > deadline:
+                raise multiprocessing.TimeoutError
+            time.sleep(0.05)
+        ok, value = self.result
+        if not ok:
+            raise value
+        return value
+
+    def elapsed(self):
+        self.pool._dispatch()
+        return None if self.started_at is None else time.time() - self.started_at
+
+    def cancel(self, on_late=None):
+        # A killed job never finishes, so on_late is never called; it is accepted to match Job.cancel()
+        self.pool._cancel(self)
+
+class ProcessPool:
+    # Runs every job in a process of its own, at most ``processes`` at a time and the rest queued in order,
+    # so a job can be killed mid-step without breaking a pool. Each job pays for starting an interpreter,
+    # which suits long background fits only. There is no dispatcher thread: any caller polling a job starts
+    # queued jobs and kills those past the deadline given at submit, so a job whose session is gone still ends
+    def __init__(self, processes=None, nice=0):
+        self.processes = processes or int(os.environ.get("WORKER_PROCESSES", 0)) or os.cpu_count()
+        self.nice = nice
+        self._queue = deque()
+        self._running = []
+        self._lock = threading.Lock()
+
+    def submit(self, func, args=(), kwargs=None, deadline=None):
+        # deadline (seconds from the job's start) kills the job even if nobody cancels it
+        job = ProcessJob(self, func, args, kwargs or {}, deadline)
+        with self._lock:
+            self._queue.append(job)
+        self._dispatch()
+        return job
+
+    def _cancel(self, job):
+        with self._lock:
+            job.cancelled = True
+            if job in self._queue:
+                self._queue.remove(job)
+            if job in self._running:
+                self._stop(job)
+            if job.result is None:
+                job.result = (False, FitCancelled("cancelled"))
+
+    def _stop(self, job):
+        job.process.kill()
+        job.process.join()
+        job.conn.close()
+        self._running.remove(job)
+
+    def _dispatch(self):
+        with self._lock:
+            for job in list(self._running):
+                if job.conn.poll():
+                    try:
+                        job.result = job.conn.recv()
+                    except EOFError:
+                        job.result = (False, RuntimeError(f"worker exited with code {job.process.exitcode}"))
+                    self._stop(job)
+                elif not job.process.is_alive():
+                    job.result = (False, RuntimeError(f"worker exited with code {job.process.exitcode}"))
+                    self._stop(job)
+                elif job.deadline is not None and time.time() - job.started_at > job.deadline:
+                    job.result = (False, JobTimeout(f"did not finish within {job.deadline:.0f}s"))
+                    self._stop(job)
+            while self._queue and len(self._running) < self.processes:
+                job = self._queue.popleft()
+                context = multiprocessing.get_context("spawn")
+                job.conn, child_conn = context.Pipe(duplex=False)
+                func, args, kwargs = job.call
+                # daemon processes die with the server
+                job.process = context.Process(target=_run_in_process, args=(child_conn, self.nice, func, args, kwargs),
+                                              daemon=True)
+                job.process.start()
+                child_conn.close()
+                job.started_at = time.time()
+                self._running.append(job)
+
 
+_shared_pools = {}
+_shared_pools_lock = threading.Lock()
 
+def shared_pool(name, processes=None, nice=0, killable=False):
+    # One pool per name for every session of this server process, so the number of worker processes stays
+    # fixed however many analysts are connected; WORKER_PROCESSES sizes pools created without processes.
+    # killable=True gives a ProcessPool, whose jobs are killed when cancelled
+    with _shared_pools_lock:
+        if name not in _shared_pools:
+            _shared_pools[name] = ProcessPool(processes, nice) if killable else WorkerPool(processes, nice, shared=True)
+        return _shared_pools[name]
@@ -1,15 +1,66 @@
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
-import matplotlib.pyplot as plt
-from statsmodels.tsa.seasonal import seasonal_decompose
-from statsmodels.tsa.stattools import acf, pacf
-from statsmodels.graphics.gofplots import qqplot
-import plotly.express as px
+import numpy as np
+from apps.autocorr import autocorrelation
+from apps.profiling import traced
+from apps.series import as_series
 
+# Roughly two points per horizontal pixel of a wide chart, more would not be visible anyway
+MAX_POINTS = 2000
 
 
-def plot_entire_data(df, date_col, target_col):
-    df = df.reset_index() 
+def lttb_indices(y, n_out):
+    # Largest-Triangle-Three-Buckets on an evenly spaced series: keeps the first and last point and,
+    # from each bucket, the point forming the largest triangle with its neighbours, preserving peaks
+    y = np.asarray(y, dtype=float)
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    indices = np.empty(n_out, dtype=int)
+    indices[0], indices[-1] = 0, n - 1
+    selected = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = (end + next_end - 1) / 2
+        avg_y = np.nanmean(y[end:next_end]) if next_end > end else y[-1]
+        xs = np.arange(start, end)
+        area = np.abs((selected - avg_x) * (y[start:end] - y[selected]) - (selected - xs) * (avg_y - y[selected]))
+        selected = start + int(np.argmax(np.nan_to_num(area, nan=-1.0)))
+        indices[i + 1] = selected
+    return indices
+
+
+def minmax_indices(y, n_out):
+    # Keeps the minimum and maximum of each bucket, cheaper than LTTB and exact for envelopes
+    y = np.asarray(y, dtype=float)
+    n = len(y)
+    buckets = n_out // 2
+    if n_out >= n or buckets < 1:
+        return np.arange(n)
+    edges = np.linspace(0, n, buckets + 1).astype(int)
+    filled = np.nan_to_num(y, nan=np.nanmean(y) if np.isfinite(y).any() else 0.0)
+    lows = [start + np.argmin(filled[start:end]) for start, end in zip(edges[:-1], edges[1:])]
+    highs = [start + np.argmax(filled[start:end]) for start, end in zip(edges[:-1], edges[1:])]
+    return np.unique(np.concatenate([lows, highs, [0, n - 1]]))
+
+
+def downsample(series, max_points=MAX_POINTS, method="lttb"):
+    if len(series) <= max_points:
+        return as_series(series)
+    indices = lttb_indices(series.to_numpy(), max_points) if method == "lttb" else minmax_indices(series.to_numpy(), max_points)
+    return series.iloc[indices]
+
+
+@traced()
+def plot_entire_data(series, date_col, target_col, window=None, max_points=MAX_POINTS):
+    # Only the visible window is sent to the browser, downsampled to a constant number of points, so
+    # zooming in through ``window`` re-queries the data at a finer resolution
+    if window is not None:
+        series = series.loc[window[0]:window[1]]
+    import plotly.express as px
+    df = downsample(series, max_points).reset_index()
     fig = px.line(df, x=date_col, y=target_col, title='Entire Data Plot')
     fig.update_xaxes(rangeslider_visible=True)
     
@@ -31,18 +82,45 @@ def plot_entire_data(df, date_col, target_col):
     )
     return fig
 
-def plot_forecasts(train, test, forecast, method):
+@traced()
+def plot_forecasts(train, test, forecast, method, bands=None, max_points=MAX_POINTS):
+    # bands holds one column per forecast quantile; each pair of quantiles symmetric around the median is
+    # drawn as a shaded band, darker towards the centre
     fig = go.Figure()
-    
+
+    train = downsample(train, max_points)
+    # Test and forecast share x values, so both keep the points selected on the test series
+    test_indices = np.arange(len(test)) if len(test) <= max_points else lttb_indices(test.to_numpy(), max_points)
+    forecast = np.asarray(forecast)[test_indices]
+    test = test.iloc[test_indices]
+
     fig.add_trace(go.Scatter(x=train.index, y=train, mode='lines', name='Train'))
     fig.add_trace(go.Scatter(x=test.index, y=test, mode='lines', name='Test'))
+    if bands is not None:
+        quantiles = sorted(bands.columns)
+        for low, high in zip(quantiles, reversed(quantiles)):
+            if low >= high:
+                break
+            name = f'{method} {high - low:.0%} interval'
+            fig.add_trace(go.Scatter(x=test.index, y=bands[high].to_numpy()[test_indices], mode='lines', line=dict(width=0),
+                                     legendgroup=name, showlegend=False, hoverinfo='skip'))
+            fig.add_trace(go.Scatter(x=test.index, y=bands[low].to_numpy()[test_indices], mode='lines', line=dict(width=0),
+                                     fill='tonexty', fillcolor='rgba(99, 110, 250, 0.2)', legendgroup=name, name=name))
     fig.add_trace(go.Scatter(x=test.index, y=forecast, mode='lines', name=f'{method} Forecast'))
     
     fig.update_layout(title=f"{method} Forecast", xaxis_title='Date', yaxis_title='Value')
     return fig
 
-def plot_decomposition(train, seasonal_periods):
-    decomposition = seasonal_decompose(train, model='additive', period=seasonal_periods)
+@traced()
+def decompose(train, seasonal_periods):
+    from statsmodels.tsa.seasonal import seasonal_decompose
+    return seasonal_decompose(as_series(train), model='additive', period=seasonal_periods)
+
+@traced()
+def plot_decomposition(train, seasonal_periods, decomposition=None):
+    import matplotlib.pyplot as plt
+    if decomposition is None:
+        decomposition = decompose(train, seasonal_periods)
     fig, axes = plt.subplots(4, 1, figsize=(15, 8), sharex=True)
     
     decomposition.observed.plot(ax=axes[0], legend=False)
@@ -56,6 +134,7 @@ def plot_decomposition(train, seasonal_periods):
     plt.tight_layout()
     return fig
 
+@traced()
 def plot_mape(kpis):
     fig = go.Figure(data=[
         go.Bar(name='SARIMAX', x=['MAPE'], y=[kpis.loc['SARIMAX', 'MAPE']]),
@@ -65,26 +144,46 @@ def plot_mape(kpis):
     fig.update_layout(barmode='group', title='MAPE Comparison', xaxis_title='KPI', yaxis_title='Value')
     return fig
 
-def plot_acf_pacf(series):
+@traced()
+def plot_backtest(folds, metric="MAPE"):
+    import plotly.express as px
+    fig = px.line(folds, x="Cutoff", y=metric, color="Model", markers=True, title=f"{metric} by Forecast Origin")
+    fig.update_layout(xaxis_title='Forecast Origin', yaxis_title=metric)
+    return fig
+
+def add_confidence_band(fig, band, name, **subplot):
+    lags = np.arange(len(band))
+    for sign in (1, -1):
+        fig.add_trace(go.Scatter(x=lags, y=sign * band, mode='lines', line=dict(dash='dash', color='gray', width=1),
+                                 name=f'{name} 95% band', showlegend=False), **subplot)
+
+@traced()
+def plot_acf_pacf(series, seasonal_period=None):
     # Calculate ACF and PACF
-    acf_vals = acf(series, nlags=50)
-    pacf_vals = pacf(series, nlags=50)
+    result = autocorrelation(series, seasonal_period)
+    acf_vals, pacf_vals = result['acf'], result['pacf']
     
     # Create subplots
     fig = make_subplots(rows=1, cols=2, subplot_titles=('ACF', 'PACF'))
     
     # ACF Plot
     fig.add_trace(go.Bar(x=list(range(len(acf_vals))), y=acf_vals, name='ACF'), row=1, col=1)
+    add_confidence_band(fig, result['acf_band'], 'ACF', row=1, col=1)
     
     # PACF Plot
     fig.add_trace(go.Bar(x=list(range(len(pacf_vals))), y=pacf_vals, name='PACF'), row=1, col=2)
+    add_confidence_band(fig, result['pacf_band'], 'PACF', row=1, col=2)
     
     fig.update_layout(title_text='ACF and PACF Plots', height=400)
     
     return fig
 
+@traced()
 def plot_sarimax_diagnostics(model_fit):
+    from statsmodels.graphics.gofplots import qqplot
     residuals = model_fit.resid
+    seasonal_period = model_fit.model.seasonal_periods
+    result = autocorrelation(residuals, seasonal_period)
     
     # Residuals plot
     fig_residuals = go.Figure()
@@ -100,15 +199,17 @@ def plot_sarimax_diagnostics(model_fit):
     qq_fig.update_layout(title='Q-Q Plot', xaxis_title='Theoretical Quantiles', yaxis_title='Sample Quantiles')
     
     # ACF plot
-    acf_vals = acf(residuals, nlags=50)
+    acf_vals = result['acf']
     fig_acf = go.Figure()
     fig_acf.add_trace(go.Bar(x=list(range(len(acf_vals))), y=acf_vals, name='ACF'))
+    add_confidence_band(fig_acf, result['acf_band'], 'ACF')
     fig_acf.update_layout(title='ACF', xaxis_title='Lags', yaxis_title='ACF')
     
     # PACF plot
-    pacf_vals = pacf(residuals, nlags=50)
+    pacf_vals = result['pacf']
     fig_pacf = go.Figure()
     fig_pacf.add_trace(go.Bar(x=list(range(len(pacf_vals))), y=pacf_vals, name='PACF'))
+    add_confidence_band(fig_pacf, result['pacf_band'], 'PACF')
     fig_pacf.update_layout(title='PACF', xaxis_title='Lags', yaxis_title='PACF')
     
     return fig_residuals, qq_fig, fig_acf, fig_pacf
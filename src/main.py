@@ -1,6 +1,5 @@
 import streamlit as st
 from multiapp import MultiApp
-from apps import home, forecast
 
 
 
@@ -14,8 +13,9 @@ st.set_page_config(
 app = MultiApp()
 
 # Add all your application here
-app.add_app("Home", home.app)
-app.add_app("Forecast", forecast.app)
+# Pages are imported on first navigation, so opening Home does not load the modelling stack
+app.add_app("Home", "apps.home:app")
+app.add_app("Forecast", "apps.forecast:app")
 
 # The main app
 app.run()
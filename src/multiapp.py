@@ -1,3 +1,5 @@
+import importlib
+
 import streamlit as st
 
 class MultiApp:
@@ -5,15 +7,23 @@ class MultiApp:
         self.apps = []
 
     def add_app(self, title, func):
+        # func is a callable, or "module:function" to import the page on first navigation
         self.apps.append({
             "title": title,
             "function": func
         })
 
+    @staticmethod
+    def load(func):
+        if callable(func):
+            return func
+        module, _, name = func.partition(":")
+        return getattr(importlib.import_module(module), name or "app")
+
     def run(self):
         app = st.sidebar.radio(
             'Navigation',
             self.apps,
             format_func=lambda app: app['title'])
 
-        app['function']()
+        self.load(app['function'])()